@@ -0,0 +1,329 @@
+"""
+Memory-mappable model artifacts
+Tree ensembles (random forests, extra trees, single decision trees) are
+flattened into a directory of .npy arrays (children, split feature,
+threshold, leaf values) plus a JSON manifest. The arrays are opened
+read-only with mmap, so every Streamlit worker shares one copy through
+the page cache and loading takes milliseconds; prediction walks all trees
+at once with vectorized numpy. Any other pickled object is re-dumped with
+joblib uncompressed, which memory-maps the numpy arrays it contains.
+
+Convert the existing pickles (written next to each .pkl):
+    python -m models.artifacts models/wqi/random_forest_wqi.pkl models/raman/raman_model.pkl
+"""
+
+import os
+import json
+import shutil
+import argparse
+import threading
+import numpy as np
+import joblib
+
+ARTIFACT_SUFFIX = '.artifact'
+MANIFEST = 'manifest.json'
+JOBLIB_FILE = 'model.joblib'
+PREDICT_CHUNK = 4096
+TREE_ARRAYS = ('left', 'right', 'feature', 'threshold', 'value', 'roots')
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_PICKLES = [
+    os.path.join(PROJECT_ROOT, 'models', 'wqi', 'random_forest_wqi.pkl'),
+    os.path.join(PROJECT_ROOT, 'models', 'raman', 'raman_model.pkl'),
+    os.path.join(PROJECT_ROOT, 'models', 'digital_twin', 'twin_simulator.pkl'),
+    # Read by pipeline/water_quality_handler.py
+    os.path.join(PROJECT_ROOT, 'model', 'river_wqi_model.pkl')
+]
+
+
+def artifact_path(model_path):
+    """Artifact directory for a pickle path: model.pkl -> model.artifact/"""
+    return os.path.splitext(model_path)[0] + ARTIFACT_SUFFIX
+
+
+class TreeEnsembleArtifact:
+    """Read-only tree ensemble with the predict / predict_proba interface of sklearn"""
+
+    def __init__(self, arrays, manifest):
+        self.left = arrays['left']
+        self.right = arrays['right']
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.value = arrays['value']            # (n_nodes, n_classes) or (n_nodes, 1)
+        self.roots = arrays['roots']
+        self.max_depth = manifest['max_depth']
+        self.is_classifier = manifest['task'] == 'classification'
+        self.n_features_in_ = manifest['n_features']
+        if manifest.get('feature_names') is not None:
+            self.feature_names_in_ = np.array(manifest['feature_names'], dtype=object)
+        if self.is_classifier:
+            self.classes_ = np.array(manifest['classes'])
+
+    def _as_array(self, X):
+        if hasattr(X, 'columns') and hasattr(self, 'feature_names_in_'):
+            X = X[list(self.feature_names_in_)]
+        # sklearn trees split on float32 features
+        X = np.asarray(X, dtype=np.float32)
+        return X.reshape(1, -1) if X.ndim == 1 else X
+
+    def _leaf_values(self, X):
+        """Mean leaf value over all trees, (n_samples, n_values)"""
+        X = self._as_array(X)
+        out = np.empty((len(X), self.value.shape[1]))
+        for start in range(0, len(X), PREDICT_CHUNK):
+            block = X[start:start + PREDICT_CHUNK]
+            rows = np.arange(len(block))[:, None]
+            node = np.broadcast_to(self.roots, (len(block), len(self.roots))).copy()
+            for _ in range(self.max_depth):
+                left = self.left[node]
+                leaf = left < 0
+                if leaf.all():
+                    break
+                go_left = block[rows, np.maximum(self.feature[node], 0)] <= self.threshold[node]
+                node = np.where(leaf, node, np.where(go_left, left, self.right[node]))
+            out[start:start + len(block)] = self.value[node].mean(axis=1)
+        return out
+
+    def predict_proba(self, X):
+        if not self.is_classifier:
+            raise AttributeError("predict_proba is only available for classifiers")
+        return self._leaf_values(X)
+
+    def predict(self, X):
+        values = self._leaf_values(X)
+        if self.is_classifier:
+            return self.classes_[np.argmax(values, axis=1)]
+        return values[:, 0]
+
+
+def _trees_of(model):
+    """
+    Fitted sklearn trees of a random forest, extra-trees or single decision
+    tree, else None. Other ensembles (boosting, bagging) weight their trees
+    or feed them feature subsets, which a plain mean over trees would get
+    wrong, so they go through joblib
+    """
+    from sklearn.ensemble import (RandomForestClassifier, RandomForestRegressor,
+                                  ExtraTreesClassifier, ExtraTreesRegressor)
+    from sklearn.tree import BaseDecisionTree
+
+    forests = (RandomForestClassifier, RandomForestRegressor, ExtraTreesClassifier, ExtraTreesRegressor)
+    if isinstance(model, forests):
+        trees = list(model.estimators_)
+    elif isinstance(model, BaseDecisionTree):
+        trees = [model]
+    else:
+        return None
+    if not all(isinstance(t, BaseDecisionTree) and hasattr(t, 'tree_') for t in trees):
+        return None
+    if any(t.tree_.n_outputs != 1 for t in trees):
+        return None
+    return trees
+
+
+def _flatten_trees(model, trees):
+    """Concatenate every tree's node arrays with global node ids"""
+    is_classifier = hasattr(model, 'classes_')
+    left, right, feature, threshold, value, roots = [], [], [], [], [], []
+    offset, max_depth = 0, 0
+
+    for tree in trees:
+        t = tree.tree_
+        children_left = t.children_left.astype(np.int32)
+        children_right = t.children_right.astype(np.int32)
+        leaf = children_left < 0
+        left.append(np.where(leaf, -1, children_left + offset))
+        right.append(np.where(leaf, -1, children_right + offset))
+        feature.append(t.feature.astype(np.int32))
+        threshold.append(t.threshold.astype(np.float64))
+
+        v = t.value[:, 0, :].astype(np.float64)
+        if is_classifier:
+            # Leaf class counts (older sklearn) or fractions -> probabilities
+            v = v / np.maximum(v.sum(axis=1, keepdims=True), 1e-12)
+        value.append(v)
+        roots.append(offset)
+        offset += t.node_count
+        max_depth = max(max_depth, t.max_depth)
+
+    arrays = {
+        'left': np.concatenate(left), 'right': np.concatenate(right),
+        'feature': np.concatenate(feature), 'threshold': np.concatenate(threshold),
+        'value': np.concatenate(value), 'roots': np.array(roots, dtype=np.int32)
+    }
+    feature_names = getattr(model, 'feature_names_in_', None)
+    manifest = {
+        'format': 'tree_ensemble',
+        'task': 'classification' if is_classifier else 'regression',
+        'source_type': type(model).__name__,
+        'n_trees': len(trees),
+        'n_nodes': int(offset),
+        'max_depth': int(max_depth),
+        'n_features': int(getattr(model, 'n_features_in_', trees[0].tree_.n_features)),
+        'feature_names': None if feature_names is None else [str(f) for f in feature_names],
+        'classes': model.classes_.tolist() if is_classifier else None
+    }
+    return arrays, manifest
+
+
+def save_artifact(model, out_dir, check=False):
+    """
+    Write a model as an artifact directory (built aside, then swapped in)
+    With check, a tree ensemble must reproduce the model's predictions
+    before it replaces anything; otherwise ValueError and nothing is written
+    """
+    tmp_dir = out_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    try:
+        trees = _trees_of(model)
+        if trees is not None:
+            arrays, manifest = _flatten_trees(model, trees)
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_dir, f'{name}.npy'), array)
+        else:
+            # Uncompressed joblib keeps numpy arrays mmap-able on load
+            joblib.dump(model, os.path.join(tmp_dir, JOBLIB_FILE), compress=0)
+            manifest = {'format': 'joblib', 'source_type': type(model).__name__}
+
+        with open(os.path.join(tmp_dir, MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        if check and manifest['format'] == 'tree_ensemble' and not _same_predictions(model, tmp_dir, manifest):
+            raise ValueError(f"Converted {manifest['source_type']} disagrees with the original model")
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return manifest
+
+
+def _same_predictions(model, artifact_dir, manifest):
+    """Whether an artifact reproduces the model on random inputs"""
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(64, manifest['n_features']))
+    if manifest['feature_names'] is not None:
+        import pandas as pd
+        X = pd.DataFrame(X, columns=manifest['feature_names'])
+    loaded = load_artifact(artifact_dir)
+    if manifest['task'] == 'classification':
+        return np.allclose(model.predict_proba(X), loaded.predict_proba(X))
+    return np.allclose(model.predict(X), loaded.predict(X))
+
+
+def load_artifact(artifact_dir):
+    """Open an artifact directory with its arrays memory-mapped read-only"""
+    with open(os.path.join(artifact_dir, MANIFEST)) as f:
+        manifest = json.load(f)
+
+    if manifest['format'] == 'tree_ensemble':
+        arrays = {name: np.load(os.path.join(artifact_dir, f'{name}.npy'), mmap_mode='r')
+                  for name in TREE_ARRAYS}
+        return TreeEnsembleArtifact(arrays, manifest)
+    return joblib.load(os.path.join(artifact_dir, JOBLIB_FILE), mmap_mode='r')
+
+
+def load_model(model_path):
+    """
+    Load a model by its pickle path, preferring the converted artifact when
+    it is at least as new as the pickle
+    """
+    artifact_dir = artifact_path(model_path)
+    manifest = os.path.join(artifact_dir, MANIFEST)
+    if os.path.exists(manifest) and (
+            not os.path.exists(model_path) or os.path.getmtime(manifest) >= os.path.getmtime(model_path)):
+        return load_artifact(artifact_dir)
+
+    # joblib.load also reads plain pickles
+    return joblib.load(model_path)
+
+
+def model_version(model_path):
+    """Modification time of whichever file load_model would read, or None"""
+    manifest = os.path.join(artifact_path(model_path), MANIFEST)
+    times = [os.path.getmtime(p) for p in (model_path, manifest) if os.path.exists(p)]
+    return max(times) if times else None
+
+
+_cache = {}                 # absolute pickle path -> (version, model)
+_cache_lock = threading.Lock()
+_reloading = set()
+
+
+def get_model(model_path):
+    """
+    Process-wide cached load_model with hot reload
+    Each call compares the file's modification time with the cached copy's;
+    when it changed, one caller loads the new version while the others keep
+    using the old one, and the cache entry is replaced in a single swap. If
+    the new file can't be read (e.g. still being written), the previous
+    model stays in use until the file changes again.
+    """
+    key = os.path.abspath(model_path)
+    version = model_version(key)
+    entry = _cache.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and (entry[0] == version or key in _reloading):
+            return entry[1]
+        _reloading.add(key)
+
+    try:
+        model = load_model(key)
+    except Exception:
+        if entry is None:
+            raise
+        # Not retried until the file changes again
+        model = entry[1]
+    finally:
+        with _cache_lock:
+            _reloading.discard(key)
+
+    with _cache_lock:
+        _cache[key] = (version, model)
+    return model
+
+
+def clear_model_cache(model_path=None):
+    """Drop one cached model, or all of them"""
+    with _cache_lock:
+        if model_path is None:
+            _cache.clear()
+        else:
+            _cache.pop(os.path.abspath(model_path), None)
+
+
+def convert_pickle(model_path, out_dir=None, check=True):
+    """
+    Convert one pickle; optionally verify predictions match on random
+    inputs, in which case a mismatching conversion is never installed
+    """
+    model = joblib.load(model_path)
+    return save_artifact(model, out_dir or artifact_path(model_path), check=check)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert pickled models to memory-mappable artifacts")
+    parser.add_argument('pickles', nargs='*', default=DEFAULT_PICKLES)
+    parser.add_argument('--no-check', action='store_true', help="Skip the prediction comparison")
+    args = parser.parse_args()
+
+    for path in args.pickles:
+        if not os.path.exists(path):
+            print(f"⚠️ {path} not found, skipped")
+            continue
+        try:
+            manifest = convert_pickle(path, check=not args.no_check)
+            print(f"✅ {path} → {artifact_path(path)} ({manifest['format']}, {manifest['source_type']})")
+        except Exception as e:
+            print(f"❌ {path}: {e}")
+
+
+if __name__ == '__main__':
+    main()
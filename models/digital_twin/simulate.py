@@ -1,5 +1,5 @@
-import pickle
 import numpy as np
+from models.artifacts import load_model
 
 def run_digital_twin_simulation(scenario_params, duration_days=30):
     """
@@ -7,8 +7,7 @@ def run_digital_twin_simulation(scenario_params, duration_days=30):
     """
     try:
         # Load simulator
-        with open('models/digital_twin/twin_simulator.pkl', 'rb') as f:
-            simulator = pickle.load(f)
+        simulator = load_model('models/digital_twin/twin_simulator.pkl')
         
         # Extract parameters
         pollution_load = scenario_params.get('pollution_load', 100)
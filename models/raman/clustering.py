@@ -0,0 +1,301 @@
+"""
+Campaign-level clustering of Raman spectra
+All-pairs cosine similarity is computed block by block in float32 matrix
+products sized to a memory budget, keeping only each spectrum's k nearest
+neighbours. Spectra linked by nearest-neighbour edges above a
+similarity threshold form clusters (connected components), so material
+groups outside the classifier's five polymers show up without fixing the
+number of clusters in advance.
+
+Usage:
+    python -m models.raman.clustering campaign_spectra.npy --out outputs/raman_clusters
+    python -m models.raman.clustering data/raman_dataset/raman_merged_labeled.csv
+"""
+
+import os
+import json
+import argparse
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+MEMORY_BUDGET_MB = 512
+NEIGHBOURS = 10
+SIMILARITY_THRESHOLD = 0.95
+MIN_CLUSTER_SIZE = 5
+PROJECTION_DIM = 64         # PCA dimensions for the pairwise pass (None = full spectra)
+NOISE_LABEL = -1
+TOPK_GROUP = 32
+
+
+def _row_norms(spectra, chunk=65536):
+    def norms(block):
+        return np.sqrt(np.einsum('ij,ij->i', block, block))
+    return np.concatenate([
+        norms(np.asarray(spectra[i:i + chunk], dtype=np.float32))
+        for i in range(0, len(spectra), chunk)
+    ])
+
+
+def _unit_block(spectra, norms, start, stop):
+    block = np.asarray(spectra[start:stop], dtype=np.float32)
+    return block / np.maximum(norms[start:stop, None], 1e-12)
+
+
+def project_spectra(spectra, n_components=PROJECTION_DIM, sample=5000, chunk=65536):
+    """Unit-norm spectra projected on their leading (uncentred) principal axes"""
+    norms = _row_norms(spectra)
+    rng = np.random.default_rng(0)
+    rows = np.sort(rng.choice(len(spectra), size=min(sample, len(spectra)), replace=False))
+    fit = _unit_block(np.asarray(spectra[rows]), norms[rows], 0, len(rows))
+    _, _, vt = np.linalg.svd(fit.astype(np.float64), full_matrices=False)
+    components = vt[:n_components].astype(np.float32)
+
+    return np.vstack([
+        _unit_block(spectra, norms, i, min(i + chunk, len(spectra))) @ components.T
+        for i in range(0, len(spectra), chunk)
+    ])
+
+
+def block_size(n_features, memory_budget_mb=MEMORY_BUDGET_MB, k=NEIGHBOURS, group=TOPK_GROUP):
+    """
+    Rows per block so everything alive at once fits the budget: two input
+    blocks, their similarity block and the top-k search temporaries
+    (group maxima and their ranking, about 3 b^2 / group, plus at most
+    (k + 1) * group candidate values and int64 positions per row)
+    """
+    budget = memory_budget_mb * 1024 * 1024 / 4        # float32 elements
+    # (1 + 3 / group) b^2 + (2 d + 7 (k + 1) group) b <= budget
+    a = 1 + 3 / group
+    c = 2 * n_features + 7 * (k + 1) * group
+    b = (-c + np.sqrt(c ** 2 + 4 * a * budget)) / (2 * a)
+    return max(1, int(b))
+
+
+def _block_topk(sim, k, group=TOPK_GROUP):
+    """
+    Values and column indices of the k largest entries per row
+    Columns are split into strided groups; the k groups with the largest
+    maxima, plus the columns past the last whole group, must contain the
+    row's top k, so only those are searched. sim may be a transposed view:
+    nothing the size of sim is copied
+    """
+    n, m = sim.shape
+    k = min(k, m)
+    if m <= k * group:
+        top = np.argpartition(sim, m - k, axis=1)[:, m - k:]
+        return np.take_along_axis(sim, top, axis=1), top
+
+    n_groups = m // group
+    whole = n_groups * group
+    group_max = sim[:, :whole].reshape(n, group, n_groups).max(axis=1)
+    top_groups = np.argpartition(group_max, n_groups - k, axis=1)[:, n_groups - k:]
+
+    cand = np.empty((n, k * group + m - whole), dtype=np.int64)
+    cand[:, :k * group] = (top_groups[:, :, None] + n_groups * np.arange(group)).reshape(n, -1)
+    cand[:, k * group:] = np.arange(whole, m)
+    values = np.take_along_axis(sim, cand, axis=1)
+    top = np.argpartition(values, values.shape[1] - k, axis=1)[:, -k:]
+    return np.take_along_axis(values, top, axis=1), np.take_along_axis(cand, top, axis=1)
+
+
+def _merge_topk(scores, indices, new_scores, new_indices, k):
+    """Keep the k best of the running and new candidates per row"""
+    all_scores = np.hstack([scores, new_scores])
+    all_indices = np.hstack([indices, new_indices])
+    if all_scores.shape[1] > k:
+        top = np.argpartition(-all_scores, k - 1, axis=1)[:, :k]
+        all_scores = np.take_along_axis(all_scores, top, axis=1)
+        all_indices = np.take_along_axis(all_indices, top, axis=1)
+    return all_scores, all_indices
+
+
+def knn_graph(spectra, k=NEIGHBOURS, memory_budget_mb=MEMORY_BUDGET_MB, progress=None):
+    """
+    k nearest neighbours of every spectrum by cosine similarity
+    Only blocks on or above the diagonal are computed; each serves the
+    neighbour lists of both its row and column spectra.
+    Returns (scores (N, k), indices (N, k)), unused slots have index -1.
+    """
+    n, d = spectra.shape
+    size = block_size(d, memory_budget_mb, k)
+    norms = _row_norms(spectra, size)
+    starts = list(range(0, n, size))
+
+    scores = np.full((n, k), -np.inf, dtype=np.float32)
+    indices = np.full((n, k), -1, dtype=np.int64)
+    total, done = len(starts) * (len(starts) + 1) // 2, 0
+
+    for bi, r0 in enumerate(starts):
+        r1 = min(r0 + size, n)
+        rows = _unit_block(spectra, norms, r0, r1)
+        for c0 in starts[bi:]:
+            c1 = min(c0 + size, n)
+            cols = rows if c0 == r0 else _unit_block(spectra, norms, c0, c1)
+            sim = rows @ cols.T
+            if c0 == r0:
+                np.fill_diagonal(sim, -np.inf)
+
+            values, top = _block_topk(sim, k)
+            scores[r0:r1], indices[r0:r1] = _merge_topk(
+                scores[r0:r1], indices[r0:r1], values, top + c0, k
+            )
+
+            if c0 != r0:
+                values, top = _block_topk(sim.T, k)
+                scores[c0:c1], indices[c0:c1] = _merge_topk(
+                    scores[c0:c1], indices[c0:c1], values, top + r0, k
+                )
+            # Release this pair before the next one is allocated
+            del sim, cols
+
+            done += 1
+            if progress is not None:
+                progress(done, total)
+
+    indices[~np.isfinite(scores)] = -1
+    return scores, indices
+
+
+def cluster_spectra(spectra, k=NEIGHBOURS, threshold=SIMILARITY_THRESHOLD,
+                    min_cluster_size=MIN_CLUSTER_SIZE, memory_budget_mb=MEMORY_BUDGET_MB,
+                    n_components=PROJECTION_DIM, progress=None):
+    """
+    Cluster an (N, K) spectral matrix (array or memory map)
+    Returns cluster labels (N,), NOISE_LABEL for spectra in groups smaller
+    than min_cluster_size, and one summary per cluster with its size,
+    representative row and representative spectrum, largest cluster first.
+    """
+    n = len(spectra)
+    features = spectra if n_components is None or n_components >= spectra.shape[1] \
+        else project_spectra(spectra, n_components)
+
+    scores, indices = knn_graph(features, k, memory_budget_mb, progress)
+
+    # Nearest-neighbour edges above the threshold, in either direction
+    rows = np.repeat(np.arange(n), indices.shape[1])
+    cols = indices.ravel()
+    keep = (cols >= 0) & (scores.ravel() >= threshold)
+    graph = sparse.csr_matrix((np.ones(keep.sum(), dtype=np.int8), (rows[keep], cols[keep])), shape=(n, n))
+    _, components = connected_components(graph, directed=True, connection='weak')
+
+    sizes = np.bincount(components)
+    order = np.argsort(-sizes, kind='stable')
+    order = order[sizes[order] >= min_cluster_size]
+    relabel = np.full(len(sizes), NOISE_LABEL)
+    relabel[order] = np.arange(len(order))
+    labels = relabel[components]
+
+    return labels, cluster_representatives(spectra, labels)
+
+
+def cluster_representatives(spectra, labels, chunk=65536):
+    """
+    Per cluster: size, mean cosine to the centroid and the member closest
+    to the centroid (its row and spectrum)
+    """
+    n_clusters = int(labels.max()) + 1 if len(labels) else 0
+    if n_clusters == 0:
+        return []
+    norms = _row_norms(spectra)
+
+    def members(start, stop):
+        lab = labels[start:stop]
+        rows = np.flatnonzero(lab >= 0)
+        return _unit_block(spectra, norms, start, stop)[rows], lab[rows], rows + start
+
+    centroids = np.zeros((n_clusters, spectra.shape[1]))
+    for start in range(0, len(spectra), chunk):
+        block, lab, _ = members(start, min(start + chunk, len(spectra)))
+        # One-hot product sums each cluster's spectra in one pass
+        onehot = sparse.csr_matrix((np.ones(len(lab)), (lab, np.arange(len(lab)))),
+                                   shape=(n_clusters, len(lab)))
+        centroids += onehot @ block
+    centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    centroids = centroids.astype(np.float32)
+
+    best_score = np.full(n_clusters, -np.inf)
+    best_row = np.zeros(n_clusters, dtype=np.int64)
+    total = np.zeros(n_clusters)
+    for start in range(0, len(spectra), chunk):
+        block, lab, rows = members(start, min(start + chunk, len(spectra)))
+        sim = np.einsum('nk,nk->n', block, centroids[lab])
+        total += np.bincount(lab, weights=sim, minlength=n_clusters)
+
+        # Most central member per cluster in this chunk: first after sorting by (cluster, -sim)
+        order = np.lexsort((-sim, lab))
+        first = order[np.r_[True, lab[order][1:] != lab[order][:-1]]]
+        better = sim[first] > best_score[lab[first]]
+        best_score[lab[first][better]] = sim[first][better]
+        best_row[lab[first][better]] = rows[first][better]
+
+    sizes = np.bincount(labels[labels >= 0], minlength=n_clusters)
+    return [
+        {
+            'cluster': c,
+            'size': int(sizes[c]),
+            'mean_similarity': float(total[c] / sizes[c]),
+            'representative': int(best_row[c]),
+            'representative_spectrum': np.asarray(spectra[best_row[c]], dtype=np.float32)
+        }
+        for c in range(n_clusters)
+    ]
+
+
+def label_clusters(representatives):
+    """Classifier label and confidence for each cluster's representative spectrum"""
+    from models.raman.infer import predict_polymers
+
+    if not representatives:
+        return representatives
+    result = predict_polymers(np.vstack([r['representative_spectrum'] for r in representatives]))
+    for rep, polymer, confidence in zip(representatives, result['polymers'], result['confidences']):
+        rep['polymer'] = str(polymer)
+        rep['confidence'] = float(confidence)
+    return representatives
+
+
+def save_clusters(out_dir, labels, representatives):
+    """labels.npy, representatives.npy (one spectrum per cluster) and clusters.json"""
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, 'labels.npy'), labels)
+    if representatives:
+        np.save(os.path.join(out_dir, 'representatives.npy'),
+                np.vstack([r['representative_spectrum'] for r in representatives]))
+    with open(os.path.join(out_dir, 'clusters.json'), 'w') as f:
+        json.dump([{key: value for key, value in r.items() if key != 'representative_spectrum'}
+                   for r in representatives], f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster every spectrum of a sampling campaign")
+    parser.add_argument('spectra', help="(N, K) .npy matrix or the labelled Raman dataset CSV")
+    parser.add_argument('--out', default='outputs/raman_clusters')
+    parser.add_argument('--threshold', type=float, default=SIMILARITY_THRESHOLD)
+    parser.add_argument('--neighbours', type=int, default=NEIGHBOURS)
+    parser.add_argument('--min-size', type=int, default=MIN_CLUSTER_SIZE)
+    parser.add_argument('--memory-mb', type=float, default=MEMORY_BUDGET_MB)
+    parser.add_argument('--label', action='store_true', help="Classify each cluster representative")
+    args = parser.parse_args()
+
+    if args.spectra.lower().endswith('.csv'):
+        from models.raman.dataset import load_dataset
+        spectra = load_dataset(args.spectra).intensities
+    else:
+        spectra = np.load(args.spectra, mmap_mode='r')
+
+    def report(done, total):
+        print(f"\r{done}/{total} similarity blocks", end='', flush=True)
+
+    labels, representatives = cluster_spectra(
+        spectra, args.neighbours, args.threshold, args.min_size, args.memory_mb, progress=report
+    )
+    if args.label:
+        representatives = label_clusters(representatives)
+    save_clusters(args.out, labels, representatives)
+
+    print(f"\n{len(representatives)} clusters, {int((labels == NOISE_LABEL).sum())} unclustered spectra → {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Columnar cache of the labelled Raman dataset
+The CSV is converted once into an .npy intensity matrix (memory-mapped on
+load), a Parquet table of the non-spectral columns and a JSON summary with
+the row and class counts. The cache is rebuilt only when the CSV's size or
+modification time changes.
+"""
+
+import os
+import json
+import threading
+import numpy as np
+import pandas as pd
+
+LABEL_COLUMN = 'class'
+CSV_CHUNK_ROWS = 20000
+
+
+def cache_dir_for(csv_path):
+    """Cache directory next to the CSV, e.g. raman_merged_labeled_cache/"""
+    return os.path.splitext(csv_path)[0] + '_cache'
+
+
+def source_signature(path):
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def spectral_columns(df, label_column=LABEL_COLUMN):
+    """Intensity columns and their wavenumbers (None when headers aren't numeric)"""
+    columns, axis = [], []
+    for col in df.columns:
+        if col == label_column:
+            continue
+        try:
+            axis.append(float(col))
+            columns.append(col)
+        except (TypeError, ValueError):
+            continue
+    if len(columns) >= 2:
+        return columns, np.array(axis)
+
+    numeric = df.drop(columns=[label_column], errors='ignore').select_dtypes('number')
+    return list(numeric.columns), None
+
+
+def _count_rows(csv_path):
+    """Data rows in the CSV (newlines minus the header), without parsing"""
+    lines, last = 0, b'\n'
+    with open(csv_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            lines += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        lines += 1
+    return max(0, lines - 1)
+
+
+def _write_metadata(meta, path):
+    try:
+        meta.to_parquet(path + '.parquet', index=False)
+    except ImportError:
+        # Parquet needs pyarrow; a pickle keeps the cache usable without it
+        meta.to_pickle(path + '.pkl')
+
+
+def _read_metadata(cache_dir):
+    path = os.path.join(cache_dir, 'metadata')
+    if os.path.exists(path + '.parquet'):
+        return pd.read_parquet(path + '.parquet')
+    return pd.read_pickle(path + '.pkl')
+
+
+def build_cache(csv_path, cache_dir=None, label_column=LABEL_COLUMN, chunk_rows=CSV_CHUNK_ROWS):
+    """Convert the CSV chunk by chunk; returns the summary"""
+    cache_dir = cache_dir or cache_dir_for(csv_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    source = source_signature(csv_path)
+    capacity = _count_rows(csv_path)
+
+    tmp_path = os.path.join(cache_dir, 'intensities.tmp.npy')
+    intensities, columns, axis = None, None, None
+    meta_chunks, class_counts = [], {}
+    n_rows = 0
+
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+        if columns is None:
+            columns, axis = spectral_columns(chunk, label_column)
+            if not columns:
+                raise ValueError("No intensity columns found in the Raman CSV")
+            intensities = np.lib.format.open_memmap(
+                tmp_path, mode='w+', dtype=np.float32, shape=(capacity, len(columns))
+            )
+
+        values = np.nan_to_num(chunk[columns].to_numpy(dtype=np.float32))
+        intensities[n_rows:n_rows + len(values)] = values
+        n_rows += len(values)
+
+        meta_chunks.append(chunk.drop(columns=columns))
+        if label_column in chunk.columns:
+            # value_counts keeps first-seen order with sort=False
+            for label, count in chunk[label_column].dropna().astype(str).value_counts(sort=False).items():
+                class_counts[label] = class_counts.get(label, 0) + int(count)
+
+    if intensities is None:
+        raise ValueError("The Raman CSV has no rows")
+    intensities.flush()
+    del intensities
+
+    meta = pd.concat(meta_chunks, ignore_index=True)
+    _write_metadata(meta, os.path.join(cache_dir, 'metadata'))
+    os.replace(tmp_path, os.path.join(cache_dir, 'intensities.npy'))
+    if axis is not None:
+        np.save(os.path.join(cache_dir, 'wavenumbers.npy'), axis)
+    elif os.path.exists(os.path.join(cache_dir, 'wavenumbers.npy')):
+        os.remove(os.path.join(cache_dir, 'wavenumbers.npy'))
+
+    summary = {
+        'source': source,
+        'rows': n_rows,
+        'points_per_spectrum': len(columns),
+        'label_column': label_column,
+        'class_counts': class_counts,
+        'classes': list(class_counts)
+    }
+    # Written last: a summary with the current source marks a complete cache
+    with open(os.path.join(cache_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f)
+    return summary
+
+
+def dataset_summary(csv_path, cache_dir=None, label_column=LABEL_COLUMN):
+    """Precomputed summary, rebuilding the cache first if the CSV changed"""
+    cache_dir = cache_dir or cache_dir_for(csv_path)
+    summary_path = os.path.join(cache_dir, 'summary.json')
+    if os.path.exists(summary_path):
+        with open(summary_path) as f:
+            summary = json.load(f)
+        if summary.get('source') == source_signature(csv_path) and \
+                summary.get('label_column') == label_column:
+            return summary
+    return build_cache(csv_path, cache_dir, label_column)
+
+
+class RamanDataset:
+    """Memory-mapped spectra plus their metadata table"""
+
+    def __init__(self, cache_dir, summary):
+        self.summary = summary
+        self.label_column = summary['label_column']
+        rows = summary['rows']
+        # The matrix may have spare rows if the CSV had blank lines
+        self.intensities = np.load(os.path.join(cache_dir, 'intensities.npy'), mmap_mode='r')[:rows]
+        axis_path = os.path.join(cache_dir, 'wavenumbers.npy')
+        self.wavenumbers = np.load(axis_path) if os.path.exists(axis_path) else None
+        self._cache_dir = cache_dir
+        self._metadata = None
+
+    def __len__(self):
+        return self.summary['rows']
+
+    @property
+    def metadata(self):
+        if self._metadata is None:
+            self._metadata = _read_metadata(self._cache_dir)
+        return self._metadata
+
+    def labels(self):
+        if self.label_column not in self.metadata.columns:
+            return None
+        return self.metadata[self.label_column]
+
+    def spectra(self, rows=slice(None)):
+        """Intensities for a row slice or index array, read from disk on demand"""
+        return np.asarray(self.intensities[rows])
+
+
+_datasets = {}
+_datasets_lock = threading.Lock()
+
+
+def load_dataset(csv_path, cache_dir=None, label_column=LABEL_COLUMN):
+    """Cached dataset for a CSV; reopened after the CSV changes"""
+    cache_dir = cache_dir or cache_dir_for(csv_path)
+    with _datasets_lock:
+        summary = dataset_summary(csv_path, cache_dir, label_column)
+        key = (os.path.abspath(cache_dir), label_column)
+        dataset = _datasets.get(key)
+        if dataset is None or dataset.summary['source'] != summary['source']:
+            dataset = RamanDataset(cache_dir, summary)
+            _datasets[key] = dataset
+        return dataset
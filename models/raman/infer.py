@@ -1,36 +1,78 @@
-import pickle
+import threading
 import numpy as np
+from models.artifacts import load_model
+from models.raman.preprocess import preprocess_spectra
 
-def predict_polymer(raman_spectrum):
+RAMAN_MODEL_PATH = 'models/raman/raman_model.pkl'
+POLYMER_CLASSES = {0: 'PET', 1: 'PE', 2: 'PP', 3: 'PS', 4: 'PVC'}
+
+_model = None
+_model_lock = threading.Lock()
+
+def load_raman_model(path=RAMAN_MODEL_PATH):
+    """Load the polymer classifier once per process (memory-mapped artifact if converted)"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = load_model(path)
+    return _model
+
+def clear_raman_model():
+    """Drop the cached classifier (e.g. after retraining)"""
+    global _model
+    with _model_lock:
+        _model = None
+
+def polymer_names(model):
+    """Polymer name for each predict_proba column"""
+    classes = getattr(model, 'classes_', range(len(POLYMER_CLASSES)))
+    names = []
+    for c in classes:
+        try:
+            names.append(POLYMER_CLASSES.get(int(c), 'Unknown'))
+        except (TypeError, ValueError):
+            names.append(str(c))
+    return names
+
+def predict_polymers(spectra, preprocess=False):
+    """
+    Classify a batch of spectra, shape (N, 1024), in one predict_proba pass
+    Returns polymer labels (N,), confidences (N,), the (N, n_classes)
+    probability matrix and the class names for its columns
+    preprocess=True despikes, baseline-corrects, smooths and normalizes first
+    """
+    model = load_raman_model()
+
+    spectra = np.asarray(spectra, dtype=float)
+    if spectra.ndim == 1:
+        spectra = spectra.reshape(1, -1)
+    if preprocess:
+        spectra = preprocess_spectra(spectra)
+
+    probabilities = np.asarray(model.predict_proba(spectra), dtype=float)
+    names = polymer_names(model)
+    best = np.argmax(probabilities, axis=1)
+
+    return {
+        'polymers': np.array(names, dtype=object)[best],
+        'confidences': probabilities[np.arange(len(best)), best],
+        'probabilities': probabilities,
+        'classes': names
+    }
+
+def predict_polymer(raman_spectrum, preprocess=False):
     """Predict polymer type"""
     try:
-        with open('models/raman/raman_model.pkl', 'rb') as f:
-            model = pickle.load(f)
-        
-        if isinstance(raman_spectrum, list):
-            raman_spectrum = np.array(raman_spectrum)
-        
-        if len(raman_spectrum.shape) == 1:
-            raman_spectrum = raman_spectrum.reshape(1, -1)
-        
-        prediction = model.predict(raman_spectrum)
-        probabilities = model.predict_proba(raman_spectrum)
-        
-        polymer_classes = {0: 'PET', 1: 'PE', 2: 'PP', 3: 'PS', 4: 'PVC'}
-        
-        polymer = polymer_classes.get(int(prediction[0]), 'Unknown')
-        confidence = float(np.max(probabilities[0]))
-        
-        prob_dict = {
-            polymer_classes[i]: float(probabilities[0][i])
-            for i in range(len(probabilities[0]))
-        }
-        
+        result = predict_polymers(raman_spectrum, preprocess)
+
         return {
-            'polymer': polymer,
-            'confidence': confidence,
-            'probabilities': prob_dict
+            'polymer': str(result['polymers'][0]),
+            'confidence': float(result['confidences'][0]),
+            'probabilities': {
+                name: float(p) for name, p in zip(result['classes'], result['probabilities'][0])
+            }
         }
-    
+
     except Exception as e:
-        return {'polymer': 'Unknown', 'confidence': 0.0, 'error': str(e)}
\ No newline at end of file
+        return {'polymer': 'Unknown', 'confidence': 0.0, 'error': str(e)}
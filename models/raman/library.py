@@ -0,0 +1,251 @@
+"""
+Reference-library search over labelled Raman spectra
+Reference spectra are normalized and projected onto their leading principal
+axes; a query scores every reference in the reduced space with one
+matrix-vector product, then the best candidates are re-ranked exactly on
+the full spectra. Index arrays are .npy files loaded as memory maps.
+
+The index is built from the reference CSV ahead of time, or in the
+background the first time it is needed:
+    python -m models.raman.library --csv data/raman_dataset/raman_merged_labeled.csv
+"""
+
+import os
+import json
+import shutil
+import argparse
+import threading
+import numpy as np
+from models.raman.resample import resample_spectra
+from models.raman.dataset import load_dataset, source_signature
+
+LIBRARY_CSV = 'data/raman_dataset/raman_merged_labeled.csv'
+LIBRARY_DIR = 'outputs/raman_library'
+LABEL_COLUMN = 'class'
+PCA_COMPONENTS = 32
+PCA_SAMPLE = 20000         # references used to fit the projection
+RERANK_CANDIDATES = 64     # reduced-space hits re-scored on full spectra
+QUERY_CHUNK = 64           # queries scored together (bounds the score matrix)
+METRICS = ('cosine', 'correlation')
+
+
+def _prepare(spectra, metric):
+    """Unit-norm rows; correlation is cosine on mean-centred spectra"""
+    spectra = np.asarray(spectra, dtype=np.float32)
+    if spectra.ndim == 1:
+        spectra = spectra.reshape(1, -1)
+    if metric == 'correlation':
+        spectra = spectra - spectra.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(spectra, axis=1, keepdims=True)
+    return spectra / np.where(norms > 0, norms, 1.0)
+
+
+def read_reference_csv(csv_path=LIBRARY_CSV, label_column=LABEL_COLUMN):
+    """(spectra on the canonical grid, labels) from the labelled reference CSV"""
+    dataset = load_dataset(csv_path, label_column=label_column)
+    labels = dataset.labels()
+    if labels is None:
+        rows = np.arange(len(dataset))
+        labels = np.full(len(dataset), 'Unknown')
+    else:
+        rows = np.flatnonzero(labels.notna().to_numpy())
+        labels = labels.iloc[rows].astype(str).to_numpy()
+
+    spectra = dataset.spectra(rows)
+    if dataset.wavenumbers is not None:
+        spectra = resample_spectra(spectra, dataset.wavenumbers).astype(np.float32)
+    return spectra, labels
+
+
+class SpectralLibrary:
+    """Top-k spectral matching against a fixed reference set"""
+
+    def __init__(self, full, reduced, components, labels, metric='cosine'):
+        self.full = full                # (N, K) unit-norm float32
+        self.reduced = reduced          # (N, C) float32, full @ components.T
+        self.components = components    # (C, K)
+        self.labels = labels
+        self.metric = metric
+
+    def __len__(self):
+        return len(self.labels)
+
+    @classmethod
+    def build(cls, spectra, labels, metric='cosine', n_components=PCA_COMPONENTS,
+              sample=PCA_SAMPLE):
+        if metric not in METRICS:
+            raise ValueError(f"metric must be one of {METRICS}")
+        full = _prepare(spectra, metric)
+
+        # Uncentred PCA (SVD) keeps reduced dot products close to full ones
+        rng = np.random.default_rng(0)
+        rows = rng.choice(len(full), size=min(sample, len(full)), replace=False)
+        _, _, vt = np.linalg.svd(full[rows].astype(np.float64), full_matrices=False)
+        components = vt[:min(n_components, len(vt))].astype(np.float32)
+
+        reduced = full @ components.T
+        return cls(full, reduced, components, np.asarray(labels).astype(str), metric)
+
+    def save(self, index_dir=LIBRARY_DIR, source=None):
+        os.makedirs(index_dir, exist_ok=True)
+        np.save(os.path.join(index_dir, 'full.npy'), self.full)
+        np.save(os.path.join(index_dir, 'reduced.npy'), self.reduced)
+        np.save(os.path.join(index_dir, 'components.npy'), self.components)
+        np.save(os.path.join(index_dir, 'labels.npy'), self.labels)
+        with open(os.path.join(index_dir, 'library.json'), 'w') as f:
+            json.dump({'metric': self.metric, 'size': len(self), 'source': source}, f)
+
+    @classmethod
+    def load(cls, index_dir=LIBRARY_DIR):
+        with open(os.path.join(index_dir, 'library.json')) as f:
+            info = json.load(f)
+        return cls(
+            np.load(os.path.join(index_dir, 'full.npy'), mmap_mode='r'),
+            np.load(os.path.join(index_dir, 'reduced.npy')),
+            np.load(os.path.join(index_dir, 'components.npy')),
+            np.load(os.path.join(index_dir, 'labels.npy')),
+            info['metric']
+        )
+
+    def search_batch(self, spectra, k=5, candidates=RERANK_CANDIDATES):
+        """
+        Top-k references for each of M query spectra
+        Returns (indices (M, k), exact similarities (M, k))
+        """
+        queries = _prepare(spectra, self.metric)
+        n_cand = min(len(self), max(k, candidates))
+        k = min(k, n_cand)
+
+        indices = np.empty((len(queries), k), dtype=np.int64)
+        scores = np.empty((len(queries), k), dtype=np.float32)
+        for start in range(0, len(queries), QUERY_CHUNK):
+            chunk = queries[start:start + QUERY_CHUNK]
+            approx = (self.reduced @ (chunk @ self.components.T).T).T
+            if n_cand < len(self):
+                cand = np.argpartition(-approx, n_cand - 1, axis=1)[:, :n_cand]
+            else:
+                cand = np.broadcast_to(np.arange(len(self)), approx.shape)
+
+            # Exact re-rank; sorted rows keep memory-mapped reads sequential
+            rows = np.unique(cand)
+            full = np.asarray(self.full[rows], dtype=np.float32)
+            exact = np.einsum('mck,mk->mc', full[np.searchsorted(rows, cand)], chunk)
+
+            order = np.argsort(-exact, axis=1)[:, :k]
+            indices[start:start + len(chunk)] = np.take_along_axis(cand, order, axis=1)
+            scores[start:start + len(chunk)] = np.take_along_axis(exact, order, axis=1)
+        return indices, scores
+
+    def search(self, spectrum, k=5):
+        """Top-k matches for one spectrum as dicts with label and similarity"""
+        indices, scores = self.search_batch(spectrum, k)
+        return [
+            {'rank': rank + 1, 'reference': int(i), 'label': str(self.labels[i]),
+             'similarity': round(float(s), 4)}
+            for rank, (i, s) in enumerate(zip(indices[0], scores[0]))
+        ]
+
+
+_library = None
+_library_lock = threading.Lock()
+_building = None
+_build_error = None
+
+
+def _load_index(index_dir, source, metric):
+    """The saved index when it matches the reference CSV and metric, else None"""
+    info_path = os.path.join(index_dir, 'library.json')
+    if not os.path.exists(info_path):
+        return None
+    with open(info_path) as f:
+        info = json.load(f)
+    if info.get('source') != source or info.get('metric') != metric:
+        return None
+    return SpectralLibrary.load(index_dir)
+
+
+def build_library(csv_path=LIBRARY_CSV, index_dir=LIBRARY_DIR, metric='cosine'):
+    """Build and save the index (written aside, then swapped in)"""
+    source = source_signature(csv_path)
+    spectra, labels = read_reference_csv(csv_path)
+    library = SpectralLibrary.build(spectra, labels, metric)
+
+    tmp_dir = index_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    library.save(tmp_dir, source)
+    shutil.rmtree(index_dir, ignore_errors=True)
+    os.replace(tmp_dir, index_dir)
+    return len(library)
+
+
+def _build_in_background(csv_path, index_dir, metric):
+    global _build_error
+    try:
+        build_library(csv_path, index_dir, metric)
+    except Exception as e:
+        _build_error = e
+
+
+def get_library(csv_path=LIBRARY_CSV, index_dir=LIBRARY_DIR, metric='cosine', wait=False):
+    """
+    Process-wide library, memory-mapped from the on-disk index
+    When the index is missing or stale (the reference CSV or the requested
+    metric changed) it is rebuilt on a background thread and None is
+    returned until it is ready, so no request pays for the CSV conversion
+    and SVD; wait=True builds in the calling thread instead.
+    """
+    global _library, _building, _build_error
+    with _library_lock:
+        source = source_signature(csv_path)
+        if _library is not None and _library.metric == metric and \
+                getattr(_library, 'source', None) == source:
+            return _library
+
+        library = _load_index(index_dir, source, metric)
+        if library is not None:
+            library.source = source
+            _library = library
+            return _library
+
+        if not wait:
+            if _build_error is not None:
+                # Reported once; the next call starts a new build
+                error, _build_error = _build_error, None
+                raise error
+            if _building is None or not _building.is_alive():
+                _building = threading.Thread(target=_build_in_background,
+                                             args=(csv_path, index_dir, metric), daemon=True)
+                _building.start()
+            return None
+
+    build_library(csv_path, index_dir, metric)
+    return get_library(csv_path, index_dir, metric)
+
+
+def match_reference(spectrum, k=5, metric='cosine', csv_path=LIBRARY_CSV):
+    """
+    Top-k reference-library matches for a spectrum on the canonical grid
+    'building' is set while the index is still being built
+    """
+    try:
+        library = get_library(csv_path, metric=metric)
+        if library is None:
+            return {'matches': [], 'building': True}
+        return {'matches': library.search(spectrum, k)}
+    except Exception as e:
+        return {'matches': [], 'error': str(e)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the Raman reference-library index")
+    parser.add_argument('--csv', default=LIBRARY_CSV, help="Labelled reference spectra")
+    parser.add_argument('--out', default=LIBRARY_DIR)
+    parser.add_argument('--metric', choices=METRICS, default='cosine')
+    args = parser.parse_args()
+
+    size = build_library(args.csv, args.out, args.metric)
+    print(f"✅ {size} reference spectra indexed → {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Polymer classification of hyperspectral Raman maps
+A map is an (H, W, K) .npy cube with one spectrum per pixel. It is read
+through a memory map in chunks of pixels; worker processes resample,
+preprocess and classify each chunk, and the parent writes a polymer-label
+raster and a confidence raster as .npy memory maps. A per-chunk done
+bitmap is flushed after each chunk's results, so an interrupted run
+resumes where it stopped.
+
+Usage:
+    python -m models.raman.mapping scan_map.npy --axis scan_axis.npy --out outputs/raman_maps/scan
+"""
+
+import os
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+from models.raman.dataset import source_signature
+
+CHUNK_PIXELS = 4096
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+PENDING_LABEL = -1
+
+_worker = {}
+
+
+def _init_worker(map_path, axis, preprocess):
+    """Open the map and load the classifier once per worker process"""
+    from models.raman.infer import load_raman_model
+    cube = np.load(map_path, mmap_mode='r')
+    _worker['spectra'] = cube.reshape(-1, cube.shape[-1])
+    _worker['axis'] = axis
+    _worker['preprocess'] = preprocess
+    load_raman_model()
+
+
+def _classify_chunk(chunk_id, start, stop):
+    from models.raman.infer import predict_polymers
+    from models.raman.resample import resample_spectra
+
+    spectra = np.asarray(_worker['spectra'][start:stop], dtype=float)
+    if _worker['axis'] is not None:
+        spectra = resample_spectra(spectra, _worker['axis'])
+    result = predict_polymers(spectra, preprocess=_worker['preprocess'])
+
+    labels = np.argmax(result['probabilities'], axis=1).astype(np.int16)
+    return chunk_id, labels, result['confidences'].astype(np.float32), result['classes']
+
+
+def _open_outputs(out_dir, shape, n_chunks, info):
+    """Label/confidence rasters and done bitmap, reused if they match this run"""
+    info_path = os.path.join(out_dir, 'map.json')
+    paths = {name: os.path.join(out_dir, f'{name}.npy') for name in ('labels', 'confidence', 'done')}
+
+    resume = False
+    if os.path.exists(info_path) and all(os.path.exists(p) for p in paths.values()):
+        with open(info_path) as f:
+            previous = json.load(f)
+        resume = all(previous.get(key) == info[key] for key in ('source', 'shape', 'axis', 'preprocess', 'chunk_pixels'))
+
+    if resume:
+        return (np.load(paths['labels'], mmap_mode='r+'),
+                np.load(paths['confidence'], mmap_mode='r+'),
+                np.load(paths['done'], mmap_mode='r+'),
+                previous)
+
+    os.makedirs(out_dir, exist_ok=True)
+    labels = np.lib.format.open_memmap(paths['labels'], mode='w+', dtype=np.int16, shape=shape)
+    labels[:] = PENDING_LABEL
+    confidence = np.lib.format.open_memmap(paths['confidence'], mode='w+', dtype=np.float32, shape=shape)
+    done = np.lib.format.open_memmap(paths['done'], mode='w+', dtype=np.uint8, shape=(n_chunks,))
+    with open(info_path, 'w') as f:
+        json.dump(info, f)
+    return labels, confidence, done, info
+
+
+def classify_map(map_path, out_dir, axis=None, preprocess=False, workers=DEFAULT_WORKERS,
+                 chunk_pixels=CHUNK_PIXELS, progress=None):
+    """
+    Classify every pixel spectrum of an (H, W, K) map
+    axis is the map's wavenumber axis (length K); without it the spectra
+    must already be on the classifier's 1024-point grid. Returns a summary
+    with the class names, per-class pixel counts and the raster paths.
+    """
+    cube = np.load(map_path, mmap_mode='r')
+    if cube.ndim != 3:
+        raise ValueError(f"Expected an (H, W, K) map, got shape {cube.shape}")
+    height, width, n_points = cube.shape
+    axis = None if axis is None else np.asarray(axis, dtype=float)
+    if axis is not None and len(axis) != n_points:
+        raise ValueError(f"Map has {n_points} points per spectrum but the axis has {len(axis)}")
+
+    n_pixels = height * width
+    n_chunks = -(-n_pixels // chunk_pixels)
+    info = {
+        'source': source_signature(map_path),
+        'shape': [height, width],
+        'axis': None if axis is None else [float(axis[0]), float(axis[-1]), len(axis)],
+        'preprocess': bool(preprocess),
+        'chunk_pixels': chunk_pixels,
+        'classes': None
+    }
+    labels, confidence, done, info = _open_outputs(out_dir, (height, width), n_chunks, info)
+    flat_labels, flat_conf = labels.reshape(-1), confidence.reshape(-1)
+
+    pending = [c for c in range(n_chunks) if not done[c]]
+    completed = n_chunks - len(pending)
+    in_flight = {}
+    max_in_flight = workers * 2     # bounds the results held in memory
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(map_path, axis, preprocess)) as pool:
+        queue = iter(pending)
+        while True:
+            for chunk_id in queue:
+                start = chunk_id * chunk_pixels
+                future = pool.submit(_classify_chunk, chunk_id, start, min(start + chunk_pixels, n_pixels))
+                in_flight[future] = chunk_id
+                if len(in_flight) >= max_in_flight:
+                    break
+            if not in_flight:
+                break
+
+            finished, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in finished:
+                del in_flight[future]
+                chunk_id, chunk_labels, chunk_conf, classes = future.result()
+                start = chunk_id * chunk_pixels
+                flat_labels[start:start + len(chunk_labels)] = chunk_labels
+                flat_conf[start:start + len(chunk_conf)] = chunk_conf
+                labels.flush()
+                confidence.flush()
+
+                if info['classes'] is None:
+                    info['classes'] = classes
+                    with open(os.path.join(out_dir, 'map.json'), 'w') as f:
+                        json.dump(info, f)
+
+                # Marked only after the rasters are on disk
+                done[chunk_id] = 1
+                done.flush()
+                completed += 1
+                if progress is not None:
+                    progress(completed, n_chunks)
+
+    classes = info['classes'] or []
+    counts = np.bincount(labels[labels >= 0].ravel(), minlength=len(classes))
+    return {
+        'status': 'Raman map classified',
+        'shape': (height, width),
+        'classes': classes,
+        'pixel_counts': {name: int(n) for name, n in zip(classes, counts)},
+        'mean_confidence': float(confidence[labels >= 0].mean()) if (labels >= 0).any() else 0.0,
+        'labels_path': os.path.join(out_dir, 'labels.npy'),
+        'confidence_path': os.path.join(out_dir, 'confidence.npy')
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify every pixel of a hyperspectral Raman map")
+    parser.add_argument('map', help="(H, W, K) .npy spectral cube")
+    parser.add_argument('--axis', help=".npy wavenumber axis of length K")
+    parser.add_argument('--out', default='outputs/raman_maps/map')
+    parser.add_argument('--preprocess', action='store_true')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--chunk', type=int, default=CHUNK_PIXELS)
+    args = parser.parse_args()
+
+    axis = np.load(args.axis) if args.axis else None
+
+    def report(completed, total):
+        print(f"\r{completed}/{total} chunks", end='', flush=True)
+
+    summary = classify_map(args.map, args.out, axis, args.preprocess, args.workers, args.chunk, report)
+    print(f"\nClassified → {summary['labels_path']}, {summary['confidence_path']}")
+    print(summary['pixel_counts'])
+
+
+if __name__ == '__main__':
+    main()
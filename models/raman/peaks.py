@@ -0,0 +1,176 @@
+"""
+Characteristic-peak detection and polymer template scoring
+Peaks are found on whole (N, 1024) matrices on the canonical wavenumber
+grid: local maxima, prominence and width at half prominence. Prominence
+follows scipy.signal.peak_prominences with wlen: each base is the lowest
+point between the peak and the nearest higher sample on that side, within
+the window. A sliding minimum over the whole window is a cheap upper bound
+that screens out most maxima before the exact bases are walked. Each
+polymer template is a set of band positions; a spectrum's score for a
+polymer is the fraction of its bands with a detected peak nearby.
+"""
+
+import numpy as np
+from scipy.ndimage import minimum_filter1d
+from models.raman.resample import CANONICAL_AXIS
+
+POLYMER_PEAKS = {
+    'PE': [(2850, 'C-H symmetric stretch'), (2880, 'C-H asymmetric stretch'), (2900, 'C-H stretch')],
+    'PP': [(841, 'C-C stretch'), (973, 'C-H rock'), (2840, 'C-H stretch')],
+    'PS': [(1001, 'Ring breathing'), (1602, 'Aromatic C=C'), (3050, 'Aromatic C-H')],
+    'PET': [(1616, 'Aromatic ring'), (1730, 'C=O stretch'), (2970, 'C-H stretch')],
+    'PVC': [(638, 'C-Cl stretch'), (1430, 'CH2 bend'), (2910, 'C-H stretch')],
+    'PMMA': [(814, 'C-O stretch'), (1730, 'C=O stretch'), (2950, 'C-H stretch')]
+}
+
+PROMINENCE_WINDOW_CM = 100   # search range each side for a peak's bases
+MIN_PROMINENCE = 0.05        # fraction of each spectrum's intensity range
+MIN_WIDTH = 2                # points at half prominence
+MAX_WIDTH_CM = 120
+PEAK_TOLERANCE_CM = 12       # template band to detected peak distance
+
+
+def _points(cm, axis=CANONICAL_AXIS):
+    return max(1, int(round(cm / abs(axis[1] - axis[0]))))
+
+
+def find_peaks_batch(spectra, min_prominence=MIN_PROMINENCE, min_width=MIN_WIDTH,
+                     axis=CANONICAL_AXIS):
+    """
+    Peaks of every spectrum in an (N, K) matrix
+    Returns (N, K) prominence and width (points) arrays, zero where there is no peak
+    """
+    spectra = np.asarray(spectra, dtype=np.float32)
+    if spectra.ndim == 1:
+        spectra = spectra.reshape(1, -1)
+    n, k = spectra.shape
+    window = _points(PROMINENCE_WINDOW_CM, axis)
+
+    interior = np.zeros((n, k), dtype=bool)
+    interior[:, 1:-1] = (spectra[:, 1:-1] > spectra[:, :-2]) & (spectra[:, 1:-1] >= spectra[:, 2:])
+
+    # Lowest point within the window on each side, excluding the peak itself;
+    # one sliding minimum over the edge-padded matrix serves both sides.
+    # The true bases stop at the nearest higher sample, so they are never
+    # lower: this bound only screens, it never drops a peak scipy would keep
+    padded = np.pad(spectra, ((0, 0), (window, window)), mode='edge')
+    sliding = minimum_filter1d(padded, window, axis=1, origin=-(window // 2))
+    bases = np.maximum(sliding[:, :k], sliding[:, window + 1:window + 1 + k])
+    bound = np.where(interior, spectra - bases, 0)
+
+    scale = spectra.max(axis=1, keepdims=True) - spectra.min(axis=1, keepdims=True)
+    threshold = np.maximum(min_prominence * scale, 1e-12)
+    rows, cols = np.nonzero(bound >= threshold)
+
+    # Exact bases, walked one point per step for the screened maxima only
+    heights = spectra[rows, cols]
+    base = np.full(len(rows), -np.inf, dtype=np.float32)
+    for direction in (-1, 1):
+        side_min = heights.copy()
+        walking = np.ones(len(rows), dtype=bool)
+        for step in range(1, window + 1):
+            pos = cols + direction * step
+            walking &= (pos >= 0) & (pos < k)
+            values = spectra[rows[walking], pos[walking]]
+            still = values <= heights[walking]
+            side_min[walking] = np.where(still, np.minimum(side_min[walking], values), side_min[walking])
+            walking[walking] = still
+            if not walking.any():
+                break
+        base = np.maximum(base, side_min)
+    prominence = heights - base
+
+    keep = prominence >= threshold[rows, 0]
+    rows, cols, prominence = rows[keep], cols[keep], prominence[keep]
+
+    # Width at half prominence, grown one point per step for the candidate peaks only
+    level = spectra[rows, cols] - prominence / 2
+    widths = np.ones(len(rows), dtype=np.int32)
+    max_half = _points(MAX_WIDTH_CM, axis) // 2
+    for direction in (-1, 1):
+        growing = np.ones(len(rows), dtype=bool)
+        for step in range(1, max_half + 1):
+            pos = cols + direction * step
+            inside = (pos >= 0) & (pos < k)
+            growing &= inside
+            growing[growing] = spectra[rows[growing], pos[growing]] > level[growing]
+            if not growing.any():
+                break
+            widths += growing
+
+    keep = widths >= min_width
+    prom_out = np.zeros((n, k), dtype=np.float32)
+    width_out = np.zeros((n, k), dtype=np.int32)
+    prom_out[rows[keep], cols[keep]] = prominence[keep]
+    width_out[rows[keep], cols[keep]] = widths[keep]
+    return prom_out, width_out
+
+
+def _template_indices(axis=CANONICAL_AXIS):
+    """Grid index of every template band inside the axis range, per polymer"""
+    templates = {}
+    for polymer, peaks in POLYMER_PEAKS.items():
+        positions = [wn for wn, _ in peaks if axis.min() <= wn <= axis.max()]
+        templates[polymer] = np.abs(axis[None, :] - np.array(positions)[:, None]).argmin(axis=1)
+    return templates
+
+
+TEMPLATE_INDICES = _template_indices()
+
+
+def score_templates(prominence, axis=CANONICAL_AXIS):
+    """
+    Template match per polymer from a find_peaks_batch prominence matrix
+    Returns (polymers, scores (N, P) fraction of bands found, matched (N, P, bands) prominences)
+    """
+    templates = TEMPLATE_INDICES if axis is CANONICAL_AXIS else _template_indices(axis)
+    tolerance = _points(PEAK_TOLERANCE_CM, axis)
+    k = prominence.shape[1]
+
+    polymers = list(templates)
+    n_bands = max(len(idx) for idx in templates.values())
+    matched = np.zeros((len(prominence), len(polymers), n_bands), dtype=np.float32)
+    for j, polymer in enumerate(polymers):
+        for b, i in enumerate(templates[polymer]):
+            # Strongest peak within the tolerance of the band
+            matched[:, j, b] = prominence[:, max(0, i - tolerance):min(k, i + tolerance + 1)].max(axis=1)
+
+    counts = np.array([len(templates[p]) for p in polymers])
+    scores = (matched > 0).sum(axis=2) / np.maximum(counts, 1)
+    return polymers, scores, matched
+
+
+def match_peaks(spectra):
+    """
+    Peak-template check for (N, 1024) spectra on the canonical grid
+    The best template is the one with most bands found, ties going to the
+    larger total matched prominence
+    """
+    prominence, _ = find_peaks_batch(spectra)
+    polymers, scores, matched = score_templates(prominence)
+    strength = matched.sum(axis=2)
+    best = np.lexsort((strength.T, scores.T), axis=0)[-1] if len(scores) else np.empty(0, dtype=int)
+    return {
+        'polymers': polymers,
+        'scores': scores,
+        'best': np.array(polymers, dtype=object)[best],
+        'best_score': scores[np.arange(len(best)), best],
+        'matched_prominence': matched,
+        'peak_count': (prominence > 0).sum(axis=1)
+    }
+
+
+def peak_report(spectrum, polymer):
+    """Template bands of one polymer with whether each was found in the spectrum"""
+    prominence, _ = find_peaks_batch(spectrum)
+    polymers, scores, matched = score_templates(prominence)
+    if polymer not in polymers:
+        return []
+    j = polymers.index(polymer)
+    bands = [(wn, name) for wn, name in POLYMER_PEAKS[polymer]
+             if CANONICAL_AXIS.min() <= wn <= CANONICAL_AXIS.max()]
+    return [
+        {'wavenumber': wn, 'assignment': name, 'found': bool(matched[0, j, i] > 0),
+         'prominence': float(matched[0, j, i])}
+        for i, (wn, name) in enumerate(bands)
+    ]
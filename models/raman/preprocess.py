@@ -0,0 +1,182 @@
+"""
+Batched Raman spectrum preprocessing
+Every step works on a whole (N, K) matrix of spectra sharing one axis:
+cosmic-ray despiking, asymmetric least squares (AsLS) baseline removal,
+Savitzky-Golay smoothing and vector normalization.
+"""
+
+from functools import lru_cache
+import numpy as np
+from scipy import sparse
+from scipy.linalg import cholesky_banded, cho_solve_banded, solveh_banded
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.ndimage import convolve1d, maximum_filter1d
+from scipy.signal import savgol_filter
+
+SPIKE_THRESHOLD = 6.0      # modified z-score of the residual to a running median
+SPIKE_MEDIAN_WINDOW = 11   # points; wider than any real band's core
+SPIKE_MAX_WIDTH = 2        # cosmic rays hit 1-2 points, real bands are wider
+SPIKE_WINDOW = 3           # neighbours each side used to fill a spike
+ASLS_LAMBDA = 1e5          # baseline stiffness
+ASLS_P = 0.01              # weight of points above the baseline
+ASLS_ITERATIONS = 10
+ASLS_BLOCK = 512           # spectra per stacked banded solve
+SG_WINDOW = 11
+SG_ORDER = 3
+
+
+def _as_matrix(spectra):
+    spectra = np.asarray(spectra, dtype=float)
+    return spectra.reshape(1, -1) if spectra.ndim == 1 else spectra
+
+
+def _running_median(spectra, window, block=ASLS_BLOCK):
+    """Edge-padded running median along each row, a block of rows at a time"""
+    half = window // 2
+    out = np.empty_like(spectra)
+    for start in range(0, len(spectra), block):
+        padded = np.pad(spectra[start:start + block], ((0, 0), (half, half)), mode='edge')
+        # Partial sort of each window is about twice as fast as ndimage.median_filter
+        windows = sliding_window_view(padded, window, axis=1)
+        out[start:start + block] = np.partition(windows, half, axis=2)[:, :, half]
+    return out
+
+
+def _short_runs(mask, max_width):
+    """Keep only runs of True no longer than max_width along each row"""
+    n, k = mask.shape
+    # A False column between rows keeps runs from wrapping onto the next row
+    flat = np.hstack([mask, np.zeros((n, 1), dtype=bool)]).ravel()
+    edges = np.diff(np.concatenate([[False], flat, [False]]).astype(np.int8))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    short = (ends - starts) <= max_width
+
+    keep = np.zeros(len(flat) + 1, dtype=np.int32)
+    np.add.at(keep, starts[short], 1)
+    np.add.at(keep, ends[short], -1)
+    return np.cumsum(keep[:-1]).astype(bool).reshape(n, k + 1)[:, :k]
+
+
+def despike(spectra, threshold=SPIKE_THRESHOLD, window=SPIKE_WINDOW,
+            median_window=SPIKE_MEDIAN_WINDOW, max_width=SPIKE_MAX_WIDTH):
+    """
+    Replace cosmic-ray spikes with the mean of nearby unaffected points
+    A spike is a run of at most max_width points standing far above a
+    running median (robust z-score of the residual); the steep flanks and
+    peaks of real bands span more points and are left alone
+    """
+    spectra = _as_matrix(spectra)
+    residual = spectra - _running_median(spectra, median_window)
+
+    median = np.median(residual, axis=1, keepdims=True)
+    mad = np.median(np.abs(residual - median), axis=1, keepdims=True)
+    z = 0.6745 * (residual - median) / np.where(mad > 0, mad, np.inf)
+
+    spikes = _short_runs(z > threshold, max_width)
+    if not spikes.any():
+        return spectra.copy()
+    # A spike's flanks are distorted too
+    spikes = maximum_filter1d(spikes, size=3, axis=1)
+
+    kernel = np.ones(2 * window + 1)
+    good = (~spikes).astype(float)
+    total = convolve1d(spectra * good, kernel, axis=1, mode='nearest')
+    count = convolve1d(good, kernel, axis=1, mode='nearest')
+    filled = np.divide(total, count, out=spectra.copy(), where=count > 0)
+    return np.where(spikes, filled, spectra)
+
+
+@lru_cache(maxsize=16)
+def _penalty_bands(n_points, lam):
+    """Upper bands (3, K) of lam * D'D for the second-difference operator D"""
+    d = sparse.diags([1.0, -2.0, 1.0], [0, 1, 2], shape=(n_points - 2, n_points))
+    penalty = (d.T @ d).todia()
+
+    bands = np.zeros((3, n_points))
+    bands[0, 2:] = penalty.diagonal(2)
+    bands[1, 1:] = penalty.diagonal(1)
+    bands[2] = penalty.diagonal(0)
+    bands *= lam
+    bands.setflags(write=False)
+    return bands
+
+
+@lru_cache(maxsize=16)
+def _unit_weight_factor(n_points, lam):
+    """Cholesky factor of I + lam * D'D, shared by every spectrum on the axis"""
+    bands = _penalty_bands(n_points, lam).copy()
+    bands[2] += 1
+    factor = cholesky_banded(bands)
+    factor.setflags(write=False)
+    return factor
+
+
+def _stacked_solve(bands, weights, rhs):
+    """
+    Solve (W_i + lam * D'D) z_i = rhs_i for every row at once as one
+    block-diagonal banded system of size N*K
+    """
+    n, k = weights.shape
+    stacked = np.tile(bands, (1, n))
+    stacked[2] += weights.reshape(-1)
+    # Zero the couplings between consecutive spectra
+    stacked[0].reshape(n, k)[:, :2] = 0
+    stacked[1].reshape(n, k)[:, 0] = 0
+    return solveh_banded(stacked, rhs.reshape(-1), check_finite=False).reshape(n, k)
+
+
+def asls_baseline(spectra, lam=ASLS_LAMBDA, p=ASLS_P, n_iter=ASLS_ITERATIONS, block=ASLS_BLOCK):
+    """
+    Asymmetric least squares baseline of each spectrum
+    The first pass has uniform weights and reuses one cached factorization
+    for all rows; reweighted passes are stacked banded solves over blocks
+    """
+    spectra = _as_matrix(spectra)
+    n, k = spectra.shape
+    if k < 3:
+        return spectra.copy()
+
+    bands = _penalty_bands(k, float(lam))
+    baseline = cho_solve_banded((_unit_weight_factor(k, float(lam)), False), spectra.T,
+                                check_finite=False).T
+
+    for start in range(0, n, block):
+        y = spectra[start:start + block]
+        z = baseline[start:start + block]
+        for _ in range(n_iter - 1):
+            weights = np.where(y > z, p, 1 - p)
+            z = _stacked_solve(bands, weights, weights * y)
+        baseline[start:start + block] = z
+
+    return baseline
+
+
+def smooth(spectra, window=SG_WINDOW, order=SG_ORDER):
+    """Savitzky-Golay smoothing along the spectral axis"""
+    spectra = _as_matrix(spectra)
+    window = min(window, spectra.shape[1] - (1 - spectra.shape[1] % 2))
+    if window <= order:
+        return spectra.copy()
+    return savgol_filter(spectra, window, order, axis=1)
+
+
+def normalize(spectra):
+    """Scale each spectrum to unit Euclidean norm"""
+    spectra = _as_matrix(spectra)
+    norms = np.linalg.norm(spectra, axis=1, keepdims=True)
+    return spectra / np.where(norms > 0, norms, 1.0)
+
+
+def preprocess_spectra(spectra, despike_spectra=True, baseline=True, smoothing=True,
+                       normalization=True):
+    """Full preprocessing chain for an (N, K) matrix (or one spectrum)"""
+    spectra = _as_matrix(spectra)
+    if despike_spectra:
+        spectra = despike(spectra)
+    if baseline:
+        spectra = spectra - asls_baseline(spectra)
+    if smoothing:
+        spectra = smooth(spectra)
+    if normalization:
+        spectra = normalize(spectra)
+    return spectra
@@ -0,0 +1,96 @@
+"""
+Resampling of Raman spectra onto the model's canonical wavenumber grid
+Linear interpolation is a sparse (1024, K) operator that depends only on
+the source axis, so it is built once per distinct instrument axis and a
+whole batch sharing that axis resamples with one matrix multiply.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from scipy import sparse
+
+CANONICAL_AXIS = np.linspace(400, 3500, 1024)   # cm⁻¹, the classifier's input grid
+OPERATOR_CACHE_SIZE = 32
+
+_operators = OrderedDict()
+_operators_lock = threading.Lock()
+
+
+def _axis_key(source_axis, target_axis):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(source_axis, dtype=np.float64).tobytes())
+    h.update(np.ascontiguousarray(target_axis, dtype=np.float64).tobytes())
+    return h.digest()
+
+
+def interpolation_matrix(source_axis, target_axis=CANONICAL_AXIS):
+    """
+    Sparse (len(target), len(source)) linear interpolation operator
+    The source axis may be in any order; targets outside its range take the
+    nearest edge value (same as np.interp)
+    """
+    source_axis = np.asarray(source_axis, dtype=np.float64)
+    target_axis = np.asarray(target_axis, dtype=np.float64)
+    n_source = len(source_axis)
+
+    order = np.argsort(source_axis, kind='stable')
+    xs = source_axis[order]
+
+    right = np.clip(np.searchsorted(xs, target_axis, side='right'), 1, n_source - 1)
+    left = right - 1
+    span = xs[right] - xs[left]
+    t = np.divide(target_axis - xs[left], span, out=np.zeros_like(target_axis), where=span > 0)
+    t = np.clip(t, 0.0, 1.0)
+
+    rows = np.repeat(np.arange(len(target_axis)), 2)
+    cols = np.stack([order[left], order[right]], axis=1).reshape(-1)
+    weights = np.stack([1.0 - t, t], axis=1).reshape(-1)
+    return sparse.csr_matrix((weights, (rows, cols)), shape=(len(target_axis), n_source))
+
+
+def get_interpolation_matrix(source_axis, target_axis=CANONICAL_AXIS):
+    """Cached interpolation operator for a source axis"""
+    key = _axis_key(source_axis, target_axis)
+    with _operators_lock:
+        operator = _operators.get(key)
+        if operator is not None:
+            _operators.move_to_end(key)
+            return operator
+
+    operator = interpolation_matrix(source_axis, target_axis)
+    with _operators_lock:
+        _operators[key] = operator
+        while len(_operators) > OPERATOR_CACHE_SIZE:
+            _operators.popitem(last=False)
+    return operator
+
+
+def axis_coverage(source_axis, target_axis=CANONICAL_AXIS):
+    """Fraction of the target grid inside the measured wavenumber range"""
+    source_axis = np.asarray(source_axis, dtype=float)
+    target_axis = np.asarray(target_axis, dtype=float)
+    inside = (target_axis >= source_axis.min()) & (target_axis <= source_axis.max())
+    return float(inside.mean())
+
+
+def resample_spectra(spectra, source_axis, target_axis=CANONICAL_AXIS):
+    """
+    Resample (N, K) spectra measured on source_axis (length K) onto the
+    target grid; returns (N, len(target_axis)), or 1-D for a single spectrum
+    """
+    spectra = np.asarray(spectra, dtype=float)
+    single = spectra.ndim == 1
+    matrix = spectra.reshape(1, -1) if single else spectra
+
+    if matrix.shape[1] < 2:
+        raise ValueError("A spectrum needs at least 2 points to resample")
+    if matrix.shape[1] != len(source_axis):
+        raise ValueError(
+            f"Spectra have {matrix.shape[1]} points but the wavenumber axis has {len(source_axis)}"
+        )
+
+    operator = get_interpolation_matrix(source_axis, target_axis)
+    resampled = np.asarray((operator @ matrix.T).T)
+    return resampled[0] if single else resampled
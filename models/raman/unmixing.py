@@ -0,0 +1,147 @@
+"""
+Linear unmixing of Raman spectra into polymer endmember abundances
+Each spectrum y is modelled as a non-negative combination a @ E of the
+endmember spectra E (one per polymer). With few endmembers the exact
+non-negative least squares solution is found for all spectra at once by
+solving the normal equations on every support subset and keeping, per
+spectrum, the best feasible one; larger endmember sets use batched
+accelerated projected gradient.
+"""
+
+import json
+import threading
+from itertools import combinations
+import numpy as np
+from models.raman.dataset import source_signature
+from models.raman.library import LIBRARY_CSV, read_reference_csv
+
+EXACT_MAX_ENDMEMBERS = 8    # 2^P - 1 support subsets are enumerated
+PG_ITERATIONS = 500
+SUM_TO_ONE_WEIGHT = 100.0   # sum-to-one row weight, relative to endmember norms (FCLS)
+ENDMEMBER_CHUNK = 20000
+
+_endmembers = {}
+_endmembers_lock = threading.Lock()
+
+
+def _as_matrix(spectra):
+    spectra = np.asarray(spectra, dtype=float)
+    return spectra.reshape(1, -1) if spectra.ndim == 1 else spectra
+
+
+def class_endmembers(csv_path=LIBRARY_CSV):
+    """
+    Mean unit-norm reference spectrum per class, from the labelled dataset
+    Returns (names, (P, 1024) endmember matrix)
+    """
+    key = json.dumps(source_signature(csv_path), sort_keys=True)
+    with _endmembers_lock:
+        if key in _endmembers:
+            return _endmembers[key]
+
+        spectra, labels = read_reference_csv(csv_path)
+        names, codes = np.unique(labels, return_inverse=True)
+        sums = np.zeros((len(names), spectra.shape[1]))
+        for start in range(0, len(spectra), ENDMEMBER_CHUNK):
+            block = np.asarray(spectra[start:start + ENDMEMBER_CHUNK], dtype=float)
+            block /= np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+            np.add.at(sums, codes[start:start + ENDMEMBER_CHUNK], block)
+
+        endmembers = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+        _endmembers[key] = (list(names), endmembers)
+        return _endmembers[key]
+
+
+def _nnls_exact(gram, cross):
+    """Exact NNLS from normal equations: gram (P, P), cross (N, P) = Y @ E.T"""
+    n, p = cross.shape
+    best = np.zeros((n, p))
+    best_obj = np.zeros(n)      # objective of a = 0, relative to ||y||^2
+
+    for size in range(1, p + 1):
+        for subset in combinations(range(p), size):
+            idx = list(subset)
+            try:
+                a = np.linalg.solve(gram[np.ix_(idx, idx)], cross[:, idx].T).T
+            except np.linalg.LinAlgError:
+                continue
+            # For the least-squares solution on a support, ||Ea - y||^2 - ||y||^2 = -a.b
+            obj = -np.einsum('np,np->n', a, cross[:, idx])
+            better = (a >= 0).all(axis=1) & (obj < best_obj)
+            if better.any():
+                best[better] = 0
+                best[np.ix_(better, idx)] = a[better]
+                best_obj[better] = obj[better]
+    return best
+
+
+def _nnls_projected_gradient(gram, cross, n_iter=PG_ITERATIONS):
+    """Batched FISTA on 0.5 a G a' - a.b subject to a >= 0"""
+    step = 1.0 / max(np.linalg.eigvalsh(gram).max(), 1e-12)
+    a = np.maximum(cross @ np.linalg.pinv(gram), 0)
+    z, t = a.copy(), 1.0
+    for _ in range(n_iter):
+        a_next = np.maximum(z - step * (z @ gram - cross), 0)
+        t_next = (1 + np.sqrt(1 + 4 * t * t)) / 2
+        z = a_next + ((t - 1) / t_next) * (a_next - a)
+        a, t = a_next, t_next
+    return a
+
+
+def nnls_batch(spectra, endmembers, sum_to_one=False):
+    """
+    Non-negative abundances (N, P) for (N, K) spectra and (P, K) endmembers
+    sum_to_one=True adds the fully constrained (FCLS) sum-to-one row
+    """
+    spectra = _as_matrix(spectra)
+    endmembers = np.asarray(endmembers, dtype=float)
+    if sum_to_one:
+        delta = SUM_TO_ONE_WEIGHT * np.linalg.norm(endmembers, axis=1).max()
+        endmembers = np.hstack([endmembers, np.full((len(endmembers), 1), delta)])
+        spectra = np.hstack([spectra, np.full((len(spectra), 1), delta)])
+
+    # Everything below only needs the P x P Gram matrix and Y @ E.T
+    gram = endmembers @ endmembers.T
+    cross = spectra @ endmembers.T
+    if len(endmembers) <= EXACT_MAX_ENDMEMBERS:
+        return _nnls_exact(gram, cross)
+    return _nnls_projected_gradient(gram, cross)
+
+
+def unmix_spectra(spectra, endmembers=None, names=None, sum_to_one=False):
+    """
+    Polymer abundance fractions for (N, 1024) spectra on the canonical grid
+    Endmembers default to the per-class mean reference spectra. Returns the
+    fractions (N, P, rows sum to 1 where anything was fitted), raw
+    abundances, relative residual per spectrum and the endmember names.
+    """
+    if endmembers is None:
+        names, endmembers = class_endmembers()
+    spectra = _as_matrix(spectra)
+
+    abundances = nnls_batch(spectra, endmembers, sum_to_one)
+    totals = abundances.sum(axis=1, keepdims=True)
+    fractions = np.divide(abundances, totals, out=np.zeros_like(abundances), where=totals > 0)
+
+    residual = np.linalg.norm(spectra - abundances @ np.asarray(endmembers), axis=1)
+    norms = np.linalg.norm(spectra, axis=1)
+    return {
+        'fractions': fractions,
+        'abundances': abundances,
+        'residual': np.divide(residual, norms, out=np.zeros_like(residual), where=norms > 0),
+        'endmembers': list(names) if names is not None else [str(i) for i in range(len(endmembers))]
+    }
+
+
+def unmix_polymer(raman_spectrum):
+    """Mixture composition of one spectrum (predict_polymer-style dict)"""
+    try:
+        result = unmix_spectra(raman_spectrum)
+        return {
+            'fractions': {
+                name: float(f) for name, f in zip(result['endmembers'], result['fractions'][0])
+            },
+            'residual': float(result['residual'][0])
+        }
+    except Exception as e:
+        return {'fractions': {}, 'residual': None, 'error': str(e)}
@@ -1,12 +1,14 @@
-import pickle
 import pandas as pd
 import numpy as np
+from models.artifacts import get_model
+
+WQI_MODEL_PATH = 'models/wqi/random_forest_wqi.pkl'
 
 def predict_wqi(features_dict):
     """Predict Water Quality Index"""
     try:
-        with open('models/wqi/random_forest_wqi.pkl', 'rb') as f:
-            model = pickle.load(f)
+        # Kept in memory; reloaded when the pickle on disk is replaced
+        model = get_model(WQI_MODEL_PATH)
         
         feature_order = [
             'temperature', 'ph', 'dissolved_oxygen', 'conductivity',
@@ -0,0 +1,396 @@
+"""
+Sample embedding index for "find similar samples" retrieval
+A forward hook on the detector backbone (SPPF block) pools its feature map
+during the normal detection pass, so embeddings cost no extra inference.
+Vectors are L2-normalized float16 rows in an append-only file; queries are
+exact for small indexes and go through an inverted-file (IVF) coarse
+quantizer once the index is large. The quantizer is trained in the
+background when the index first reaches IVF_MIN_SIZE and retrained as it
+keeps growing; it can also be built by hand:
+    python -m models.yolo.embeddings --build-ivf
+"""
+
+import os
+import json
+import weakref
+import argparse
+import threading
+from datetime import datetime
+import numpy as np
+
+EMBED_INDEX_DIR = 'outputs/embedding_index'
+EMBED_DTYPE = np.float16
+SIMILAR_TOP_K = 5
+IVF_MIN_SIZE = 50000       # below this a brute-force scan is already fast
+IVF_LISTS = 1024
+IVF_PROBE = 16
+IVF_TRAIN_SAMPLE = 100000
+IVF_RETRAIN_GROWTH = 4     # retrain once the index is this many times the trained size
+IVF_TAIL_MAX = 65536       # rows added since the last list layout that are scanned directly
+SCAN_CHUNK = 16384         # rows converted to float32 at a time by a brute-force scan
+SEARCH_OVERFETCH = 4       # candidates fetched per result, so repeats of a sample can be dropped
+
+_local = threading.local()
+_hooked = weakref.WeakSet()   # hooked backbone layers (not ids, which are reused)
+_hook_lock = threading.Lock()
+
+
+def attach_embedding_hook(model):
+    """
+    Capture pooled backbone features during normal inference
+    Only PyTorch weights expose their layers; exported ONNX / OpenVINO
+    graphs return False and simply produce no embeddings
+    """
+    try:
+        import torch
+    except ImportError:
+        return False
+
+    # The predictor runs its own (fused) copy of the network, so hook that one;
+    # registry warm-up guarantees the predictor exists
+    predictor = getattr(model, 'predictor', None)
+    backend = getattr(predictor, 'model', None)
+    net = getattr(backend, 'model', None) if backend is not None else getattr(model, 'model', None)
+    if not isinstance(net, torch.nn.Module):
+        return False
+    layers = list(getattr(net, 'model', []))
+    if not layers:
+        return False
+
+    # SPPF closes the YOLOv8 backbone; fall back to the middle layer
+    target = next((m for m in layers if type(m).__name__ == 'SPPF'), layers[len(layers) // 2])
+
+    def hook(module, inputs, output):
+        # Runs on the inferring thread, so thread-local storage is per request
+        _local.embeddings = output.float().mean(dim=(2, 3)).detach().cpu().numpy()
+
+    with _hook_lock:
+        if target not in _hooked:
+            target.register_forward_hook(hook)
+            _hooked.add(target)
+    return True
+
+
+def pop_embeddings():
+    """(B, C) features from this thread's last forward pass, then clear them"""
+    embeddings = getattr(_local, 'embeddings', None)
+    _local.embeddings = None
+    return embeddings
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / (np.linalg.norm(vectors, axis=-1, keepdims=True) + 1e-12)
+
+
+class EmbeddingIndex:
+    """Append-only float16 embedding store with top-k cosine search"""
+
+    def __init__(self, index_dir=EMBED_INDEX_DIR, auto_ivf=True):
+        self.index_dir = index_dir
+        self.auto_ivf = auto_ivf
+        self.vectors_path = os.path.join(index_dir, 'vectors.f16')
+        self.meta_path = os.path.join(index_dir, 'meta.jsonl')
+        self.offsets_path = os.path.join(index_dir, 'meta_offsets.u8')
+        self.info_path = os.path.join(index_dir, 'index.json')
+        self.centroids_path = os.path.join(index_dir, 'ivf_centroids.npy')
+        self.lists_path = os.path.join(index_dir, 'ivf_lists.i4')
+        self._lock = threading.RLock()
+        self._building = None
+        self._load()
+
+    # ---------- storage ----------
+
+    def _load(self):
+        self.dim = None
+        self.size = 0
+        self.ivf_trained_size = 0
+        if os.path.exists(self.info_path):
+            with open(self.info_path) as f:
+                info = json.load(f)
+            self.dim = info['dim']
+            self.ivf_trained_size = info.get('ivf_trained_size', 0)
+            offsets = np.fromfile(self.offsets_path, dtype='<u8')
+            n_vectors = os.path.getsize(self.vectors_path) // (self.dim * 2)
+            # Records are complete only once both vector and metadata are on disk
+            self.size = int(min(len(offsets), n_vectors))
+        self._vectors = None
+        self._offsets = None
+        self._digests = None
+
+        self.centroids = np.load(self.centroids_path) if os.path.exists(self.centroids_path) else None
+        self._lists = None
+        self._n_lists = 0
+        self._members = None
+
+    def _save_info(self):
+        with open(self.info_path, 'w') as f:
+            json.dump({'dim': self.dim, 'ivf_trained_size': self.ivf_trained_size}, f)
+
+    def __len__(self):
+        return self.size
+
+    def vectors(self):
+        """Read-only memory map of the stored vectors"""
+        if self._vectors is None or len(self._vectors) != self.size:
+            self._vectors = np.memmap(self.vectors_path, dtype=EMBED_DTYPE, mode='r',
+                                      shape=(self.size, self.dim)) if self.size else \
+                np.empty((0, self.dim or 0), dtype=EMBED_DTYPE)
+        return self._vectors
+
+    def metadata(self, rows):
+        """Metadata dicts for the given row numbers"""
+        if self._offsets is None or len(self._offsets) < self.size:
+            self._offsets = np.fromfile(self.offsets_path, dtype='<u8')
+        out = []
+        with open(self.meta_path, 'rb') as f:
+            for row in rows:
+                f.seek(int(self._offsets[row]))
+                out.append(json.loads(f.readline()))
+        return out
+
+    def _known_digests(self):
+        """Image digests already in the index (read from the metadata once)"""
+        if self._digests is None:
+            self._digests = set()
+            if self.size:
+                with open(self.meta_path, 'rb') as f:
+                    for _, line in zip(range(self.size), f):
+                        self._digests.add(json.loads(line).get('digest'))
+        return self._digests
+
+    def add(self, vector, meta):
+        """
+        Append one embedding with its sample metadata
+        An image already in the index (same digest) is not added again, so
+        re-processing a file doesn't fill the results with copies of it.
+        Returns whether the embedding was stored.
+        """
+        vector = _normalize(vector).reshape(-1)
+        digest = meta.get('digest')
+
+        with self._lock:
+            if digest is not None and digest in self._known_digests():
+                return False
+            os.makedirs(self.index_dir, exist_ok=True)
+            if self.dim is None:
+                self.dim = int(vector.shape[0])
+                self._save_info()
+            if vector.shape[0] != self.dim:
+                raise ValueError(f"Embedding has {vector.shape[0]} dims, index has {self.dim}")
+
+            with open(self.meta_path, 'ab') as f:
+                offset = f.tell()
+                f.write((json.dumps(meta) + "\n").encode())
+            with open(self.vectors_path, 'ab') as f:
+                vector.astype(EMBED_DTYPE).tofile(f)
+            with open(self.offsets_path, 'ab') as f:
+                np.array([offset], dtype='<u8').tofile(f)
+            self.size += 1
+            if digest is not None:
+                self._digests.add(digest)
+
+            if self.centroids is not None:
+                self._ivf_lists()
+
+        if self.auto_ivf and self.needs_ivf():
+            self.build_ivf_async()
+        return True
+
+    # ---------- IVF ----------
+
+    def needs_ivf(self):
+        """True when the quantizer is missing or was trained on a much smaller index"""
+        if self.size < IVF_MIN_SIZE:
+            return False
+        return self.centroids is None or self.size >= IVF_RETRAIN_GROWTH * self.ivf_trained_size
+
+    def build_ivf_async(self):
+        """Train the quantizer on a background thread unless a build is running"""
+        with self._lock:
+            if self._building is not None and self._building.is_alive():
+                return
+            self._building = threading.Thread(target=self.build_ivf, daemon=True)
+            self._building.start()
+
+    def build_ivf(self, n_lists=IVF_LISTS, sample=IVF_TRAIN_SAMPLE):
+        """
+        Train the coarse quantizer and assign every stored vector to a list
+        Training and assignment run on a snapshot without holding the lock;
+        the new quantizer then replaces the old one in a single swap
+        """
+        from sklearn.cluster import MiniBatchKMeans
+
+        with self._lock:
+            size = self.size
+            vectors = self.vectors()
+        if not size:
+            return
+
+        rng = np.random.default_rng(0)
+        rows = np.sort(rng.choice(size, size=min(sample, size), replace=False))
+        kmeans = MiniBatchKMeans(n_clusters=min(n_lists, len(rows)), random_state=0, n_init=3)
+        kmeans.fit(np.asarray(vectors[rows], dtype=np.float32))
+        centroids = _normalize(kmeans.cluster_centers_)
+        lists = self._assign(vectors, centroids, 0, size)
+
+        with self._lock:
+            tmp_lists, tmp_centroids = self.lists_path + '.tmp', self.centroids_path + '.tmp.npy'
+            lists.tofile(tmp_lists)
+            np.save(tmp_centroids, centroids)
+            os.replace(tmp_lists, self.lists_path)
+            os.replace(tmp_centroids, self.centroids_path)
+
+            self.centroids = centroids
+            self._lists, self._n_lists, self._members = None, 0, None
+            self.ivf_trained_size = size
+            self._save_info()
+            # Vectors added while training are assigned (and persisted) here
+            self._ivf_lists()
+
+    @staticmethod
+    def _assign(vectors, centroids, start, stop, chunk=SCAN_CHUNK):
+        return np.concatenate([
+            np.argmax(np.asarray(vectors[i:min(i + chunk, stop)], dtype=np.float32) @ centroids.T, axis=1)
+            for i in range(start, stop, chunk)
+        ] or [np.empty(0, dtype=np.int64)]).astype(np.int32)
+
+    def _ivf_lists(self):
+        """List of every stored vector, kept in step with the lists file"""
+        with self._lock:
+            if self._lists is None:
+                lists = np.fromfile(self.lists_path, dtype=np.int32) if os.path.exists(self.lists_path) \
+                    else np.empty(0, dtype=np.int32)
+                if len(lists) > self.size:
+                    # Assignments of records that never completed
+                    lists = lists[:self.size]
+                    lists.tofile(self.lists_path)
+                self._lists = np.empty(max(2 * self.size, 1024), dtype=np.int32)
+                self._lists[:len(lists)] = lists
+                self._n_lists = len(lists)
+
+            if self._n_lists < self.size:
+                new = self._assign(self.vectors(), self.centroids, self._n_lists, self.size)
+                with open(self.lists_path, 'ab') as f:
+                    new.tofile(f)
+                if self.size > len(self._lists):
+                    # Growable buffer, so appends don't copy the whole assignment
+                    grown = np.empty(2 * self.size, dtype=np.int32)
+                    grown[:self._n_lists] = self._lists[:self._n_lists]
+                    self._lists = grown
+                self._lists[self._n_lists:self.size] = new
+                self._n_lists = self.size
+            return self._lists[:self._n_lists]
+
+    def _list_members(self):
+        """
+        CSR layout of list membership: (rows sorted by list, list offsets,
+        rows covered). Rebuilt only when more than IVF_TAIL_MAX rows were
+        added since, so appends don't re-sort the whole index
+        """
+        lists = self._ivf_lists()
+        if self._members is None or len(lists) - self._members[2] > IVF_TAIL_MAX:
+            order = np.argsort(lists, kind='stable')
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=len(self.centroids)))])
+            self._members = (order, offsets, len(lists))
+        return self._members
+
+    # ---------- search ----------
+
+    def _scan(self, vectors, query, size):
+        """Exact scores of the first size rows, converted a chunk at a time"""
+        scores = np.empty(size, dtype=np.float32)
+        for start in range(0, size, SCAN_CHUNK):
+            stop = min(start + SCAN_CHUNK, size)
+            scores[start:stop] = np.asarray(vectors[start:stop], dtype=np.float32) @ query
+        return scores
+
+    def search(self, vector, k=SIMILAR_TOP_K, exclude=None, n_probe=IVF_PROBE):
+        """
+        Top-k most similar stored samples as metadata dicts with a 'similarity'
+        One result per image digest, so samples stored more than once (by
+        older versions) don't crowd out the others
+        """
+        query = _normalize(vector).reshape(-1)
+        with self._lock:
+            size = self.size
+            if not size:
+                return []
+            vectors = self.vectors()
+            use_ivf = self.centroids is not None and size >= IVF_MIN_SIZE
+            if use_ivf:
+                centroids = self.centroids
+                lists = self._ivf_lists()
+                order, offsets, covered = self._list_members()
+
+        if use_ivf:
+            probe = np.argsort(-(centroids @ query))[:n_probe]
+            # Rows added after the list layout was built are checked directly
+            tail = covered + np.flatnonzero(np.isin(lists[covered:size], probe))
+            rows = np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probe] + [tail])
+            rows.sort()
+            scores = np.asarray(vectors[rows], dtype=np.float32) @ query
+        else:
+            rows = np.arange(size)
+            scores = self._scan(vectors, query, size)
+
+        k_fetch = min(len(scores), SEARCH_OVERFETCH * (k + 1))
+        if not k_fetch:
+            return []
+        top = np.argpartition(-scores, k_fetch - 1)[:k_fetch]
+        top = top[np.argsort(-scores[top])]
+
+        results, seen = [], {exclude}
+        for score, meta in zip(scores[top], self.metadata(rows[top])):
+            digest = meta.get('digest')
+            if digest is not None and digest in seen:
+                continue
+            seen.add(digest)
+            meta['similarity'] = round(float(score), 4)
+            results.append(meta)
+            if len(results) == k:
+                break
+        return results
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_embedding_index():
+    """Process-wide index instance"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = EmbeddingIndex()
+    return _index
+
+
+def sample_metadata(digest, name, summary):
+    """Metadata stored alongside a sample's embedding"""
+    return {
+        'digest': digest,
+        'file': name,
+        'analysed_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'count': summary.get('count', 0),
+        'particle_types': summary.get('particle_types', {})
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the sample embedding index")
+    parser.add_argument('--index', default=EMBED_INDEX_DIR)
+    parser.add_argument('--build-ivf', action='store_true', help="(Re)train the IVF quantizer now")
+    parser.add_argument('--lists', type=int, default=IVF_LISTS)
+    args = parser.parse_args()
+
+    index = EmbeddingIndex(args.index, auto_ivf=False)
+    print(f"{len(index)} embeddings of {index.dim} dims, IVF trained on {index.ivf_trained_size}")
+    if args.build_ivf:
+        index.build_ivf(args.lists)
+        print(f"✅ IVF with {len(index.centroids)} lists → {args.index}")
+
+
+if __name__ == '__main__':
+    main()
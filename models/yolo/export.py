@@ -0,0 +1,140 @@
+"""
+Export the microplastic detector to CPU inference graphs
+ONNX (onnxruntime) and OpenVINO, optionally INT8-quantized with a
+calibration set drawn from our own filter images. Outputs are written
+next to the .pt weights where models/yolo/registry.py picks them up.
+
+Usage:
+    python -m models.yolo.export --format openvino --int8 --calib data/calib_images
+"""
+
+import os
+import glob
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from PIL import Image
+from ultralytics import YOLO
+from models.yolo.registry import engine_weights
+
+EXPORT_IMGSZ = 640
+CALIB_LIMIT = 300
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png', '*.tif', '*.tiff', '*.bmp')
+
+
+def calibration_images(calib_dir, limit=CALIB_LIMIT):
+    """Sorted image paths from the calibration folder (at most limit)"""
+    paths = []
+    for pattern in IMAGE_PATTERNS:
+        paths.extend(glob.glob(os.path.join(calib_dir, pattern)))
+    return sorted(paths)[:limit]
+
+
+def _calibration_yaml(model, calib_dir, workdir):
+    """Minimal dataset yaml so ultralytics calibrates on our images"""
+    names = '\n'.join(f"  {i}: {name}" for i, name in model.names.items())
+    path = os.path.join(workdir, 'calibration.yaml')
+    with open(path, 'w') as f:
+        f.write(
+            f"path: {os.path.abspath(calib_dir)}\n"
+            f"train: .\n"
+            f"val: .\n"
+            f"names:\n{names}\n"
+        )
+    return path
+
+
+def export_onnx(weights_path, imgsz=EXPORT_IMGSZ):
+    """Export to ONNX with dynamic batch/size (batched and tiled calls need it)"""
+    model = YOLO(weights_path)
+    out = model.export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True)
+    target = engine_weights(weights_path, 'onnx')
+    if os.path.abspath(out) != os.path.abspath(target):
+        shutil.move(out, target)
+    return target
+
+
+def export_openvino(weights_path, int8=False, calib_dir=None, imgsz=EXPORT_IMGSZ):
+    """Export to OpenVINO IR, INT8 calibrated on calib_dir when requested"""
+    model = YOLO(weights_path)
+
+    if not int8:
+        model.export(format='openvino', imgsz=imgsz, dynamic=True)
+        return engine_weights(weights_path, 'openvino')
+
+    if not calib_dir or not calibration_images(calib_dir):
+        raise ValueError("INT8 export needs a folder of calibration images")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        data = _calibration_yaml(model, calib_dir, workdir)
+        model.export(format='openvino', imgsz=imgsz, dynamic=True, int8=True, data=data)
+    return engine_weights(weights_path, 'openvino-int8')
+
+
+def _preprocess(path, imgsz):
+    """Letterboxed NCHW float32 tensor, as the exported graph expects"""
+    image = Image.open(path).convert("RGB")
+    scale = imgsz / max(image.size)
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    canvas = Image.new("RGB", (imgsz, imgsz), (114, 114, 114))
+    canvas.paste(image.resize(size, Image.BILINEAR),
+                 ((imgsz - size[0]) // 2, (imgsz - size[1]) // 2))
+    arr = np.asarray(canvas, dtype=np.float32) / 255.0
+    return arr.transpose(2, 0, 1)[None]
+
+
+def quantize_onnx(weights_path, calib_dir, imgsz=EXPORT_IMGSZ):
+    """Static INT8 quantization of the ONNX export with onnxruntime"""
+    from onnxruntime.quantization import (
+        CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    )
+
+    onnx_path = engine_weights(weights_path, 'onnx')
+    if not os.path.exists(onnx_path):
+        onnx_path = export_onnx(weights_path, imgsz)
+
+    images = calibration_images(calib_dir)
+    if not images:
+        raise ValueError("INT8 quantization needs a folder of calibration images")
+
+    class FilterImageReader(CalibrationDataReader):
+        def __init__(self):
+            self.paths = iter(images)
+
+        def get_next(self):
+            path = next(self.paths, None)
+            return None if path is None else {'images': _preprocess(path, imgsz)}
+
+    target = engine_weights(weights_path, 'onnx-int8')
+    quantize_static(
+        onnx_path, target, FilterImageReader(),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True
+    )
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export YOLO weights for CPU inference")
+    parser.add_argument('--weights', default='models/yolo/best.pt')
+    parser.add_argument('--format', choices=['onnx', 'openvino'], default='onnx')
+    parser.add_argument('--int8', action='store_true', help="INT8 quantize with calibration images")
+    parser.add_argument('--calib', help="Folder of filter images used for INT8 calibration")
+    parser.add_argument('--imgsz', type=int, default=EXPORT_IMGSZ)
+    args = parser.parse_args()
+
+    if args.format == 'onnx':
+        out = export_onnx(args.weights, args.imgsz)
+        if args.int8:
+            out = quantize_onnx(args.weights, args.calib, args.imgsz)
+    else:
+        out = export_openvino(args.weights, args.int8, args.calib, args.imgsz)
+
+    print(f"Exported → {out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,19 @@
-from ultralytics import YOLO
 import cv2
+import io
+import os
+import hashlib
+import threading
 import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
+from models.yolo.registry import get_model, predict, model_fingerprint
+from models.yolo.prefilter import is_empty_frame, empty_result
+from models.yolo.roi import find_membrane, crop_to_membrane, inside_membrane
+from models.yolo.phash import phash, content_thumbnail, get_phash_index
+from models.yolo.embeddings import (
+    attach_embedding_hook, pop_embeddings, get_embedding_index, sample_metadata
+)
 
 def classify_microplastic_type(width, height):
     """Classify based on aspect ratio"""
@@ -21,73 +33,360 @@ COLOR_MAP = {
     "pellet": (0, 255, 0)      # Green
 }
 
-def predict_image_with_viz(uploaded_file, conf_threshold=0.50, user_level="Public"):
-    """YOLO detection with visualization"""
+# Index order used by the vectorized classifier
+PARTICLE_TYPES = ("fiber", "fragment", "pellet")
+PARTICLE_LABELS = np.array([t.title() for t in PARTICLE_TYPES])
+
+# Longest side the detector letterboxes inputs to
+MODEL_INPUT_SIZE = 640
+
+# JPEG DCT-domain downscaling factors supported by the decoder
+_REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
+
+# Batch processing defaults
+BATCH_SIZE = 16
+DECODE_WORKERS = 4
+
+# Empty-frame screen for batch uploads (YOLO_PREFILTER_BATCH=0 turns it off)
+PREFILTER_BATCH = os.getenv('YOLO_PREFILTER_BATCH', '1') == '1'
+# Near-duplicate reuse for citizen and government uploads (YOLO_DEDUPE=0 turns it off)
+DEDUPE_UPLOADS = os.getenv('YOLO_DEDUPE', '1') == '1'
+
+# Detections are cached once at the lowest role threshold (Researcher/Admin)
+# and filtered per role, so switching roles never re-runs the network
+CACHE_CONF_THRESHOLD = 0.10
+DETECTION_CACHE_SIZE = 256
+
+_detection_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def boxes_to_arrays(boxes):
+    """(N, 4) xyxy and (N,) confidence arrays from ultralytics Boxes"""
+    return boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy()
+
+def classify_microplastic_codes(widths, heights):
+    """Vectorized classify_microplastic_type, returns indices into PARTICLE_TYPES"""
+    widths = np.asarray(widths, dtype=float)
+    heights = np.asarray(heights, dtype=float)
+    aspect_ratio = np.maximum(widths, heights) / (np.minimum(widths, heights) + 1e-6)
+    area = widths * heights
+    
+    return np.where(aspect_ratio >= 3.5, 0, np.where(area <= 1500, 2, 1))
+
+def summarize_detections(xyxy, confs):
+    """Turn detection arrays into the result dict (columnar detection table)"""
+    xyxy = np.asarray(xyxy).reshape(-1, 4).astype(np.int64)
+    confs = np.asarray(confs, dtype=float).reshape(-1)
+    
+    widths = xyxy[:, 2] - xyxy[:, 0]
+    heights = xyxy[:, 3] - xyxy[:, 1]
+    codes = classify_microplastic_codes(widths, heights)
+    counts = np.bincount(codes, minlength=len(PARTICLE_TYPES))
+    
+    return {
+        'count': int(len(confs)),
+        'avg_confidence': float(confs.mean()) if len(confs) else 0.0,
+        'particle_types': {
+            name: int(n) for name, n in zip(PARTICLE_TYPES, counts) if n > 0
+        },
+        'detections_table': {
+            "Type": PARTICLE_LABELS[codes],
+            "Confidence": np.round(confs, 3),
+            "Width(px)": widths,
+            "Height(px)": heights
+        },
+        'individual_confidences': confs.tolist()
+    }
+
+def render_detections(img_bgr, xyxy, confs, scale=1.0):
+    """
+    Annotated RGB image with a colored box and label per detection
+    xyxy are original-image coordinates; scale maps them onto img_bgr
+    """
+    # The RGB conversion is the only full-size copy made for display
+    img_draw = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
+    xyxy = np.asarray(xyxy).reshape(-1, 4)
+    codes = classify_microplastic_codes(xyxy[:, 2] - xyxy[:, 0], xyxy[:, 3] - xyxy[:, 1])
+    xyxy_img = (xyxy / scale).astype(np.int64)
+    
+    for (x1, y1, x2, y2), code, conf in zip(xyxy_img.tolist(), codes.tolist(), np.asarray(confs).tolist()):
+        mp_type = PARTICLE_TYPES[code]
+        color = COLOR_MAP[mp_type][::-1]  # COLOR_MAP is BGR
+        
+        # Draw box
+        cv2.rectangle(img_draw, (x1, y1), (x2, y2), color, 2)
+        
+        # Add label
+        label = f"{mp_type.upper()} {conf:.2f}"
+        cv2.putText(img_draw, label, (x1, y1 - 8),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+    
+    return img_draw
+
+def _read_bytes(uploaded_file):
+    """Raw bytes of an upload, file object or path"""
+    if hasattr(uploaded_file, 'getvalue'):
+        return uploaded_file.getvalue()
+    if hasattr(uploaded_file, 'read'):
+        uploaded_file.seek(0)
+        data = uploaded_file.read()
+        uploaded_file.seek(0)
+        return data
+    with open(uploaded_file, 'rb') as f:
+        return f.read()
+
+def decode_image(data, target_side=MODEL_INPUT_SIZE):
+    """
+    Decode image bytes into one contiguous BGR array (the detector's input order)
+    JPEGs much larger than target_side are decoded at 1/2, 1/4 or 1/8 scale by
+    the JPEG decoder itself. Returns (image, scale) where scale maps decoded
+    pixel coordinates back onto the original image.
+    """
+    header = Image.open(io.BytesIO(data))  # reads the header only
+    original_side = max(header.size)
+    
+    factor = 1
+    if target_side and header.format == 'JPEG':
+        while factor < 8 and original_side // (factor * 2) >= target_side:
+            factor *= 2
+    
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), _REDUCED_DECODE_FLAGS[factor])
+    if img is None:
+        # Formats OpenCV can't read (e.g. some TIFF modes)
+        img = cv2.cvtColor(np.asarray(header.convert("RGB")), cv2.COLOR_RGB2BGR)
+    
+    return img, original_side / max(img.shape[:2])
+
+def image_digest(data):
+    """Content hash used as the detection cache key"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def roi_input(img_bgr, roi=True):
+    """Detector input for an image: (membrane crop or image, offset, circle)"""
+    circle = find_membrane(img_bgr) if roi else None
+    if circle is None:
+        return img_bgr, (0, 0), None
+    crop, offset = crop_to_membrane(img_bgr, circle)
+    return crop, offset, circle
+
+def roi_restore(xyxy, confs, offset, circle):
+    """Map crop boxes back to image pixels and drop boxes off the membrane"""
+    if circle is None:
+        return xyxy, confs
+    xyxy = xyxy + np.array([offset[0], offset[1], offset[0], offset[1]], dtype=xyxy.dtype)
+    keep = inside_membrane(xyxy, circle)
+    return xyxy[keep], confs[keep]
+
+def detect_image(model, img_bgr, conf_threshold, roi=True):
+    """Detection arrays for one decoded image, restricted to the membrane when found"""
+    img_input, offset, circle = roi_input(img_bgr, roi)
+    results = predict(model, img_input, conf=conf_threshold)[0]
+    return roi_restore(*boxes_to_arrays(results.boxes), offset, circle)
+
+def detect_cached(model, img_np, digest, conf_threshold, scale=1.0, roi=True, dedupe=False):
+    """
+    Detection arrays at conf_threshold, served from the content-hash cache
+    The network runs once per image at CACHE_CONF_THRESHOLD; any higher
+    threshold is a filter over the cached boxes. Boxes are returned in
+    original-image coordinates (decoded coordinates times scale). Models not
+    loaded through the registry (no weights fingerprint) are never cached.
+    With dedupe=True, verified near-duplicates of images previously analysed
+    by the same detector weights are answered from the perceptual-hash index
+    instead of the network.
+    """
+    # Keyed by the weights, not id(model): a model reloaded after
+    # clear_models() can reuse the old object's id
+    fingerprint = model_fingerprint(model)
+    if conf_threshold < CACHE_CONF_THRESHOLD or fingerprint is None:
+        xyxy, confs = detect_image(model, img_np, conf_threshold, roi)
+        return xyxy * scale, confs
+    
+    key = (digest, fingerprint, roi)
+    with _cache_lock:
+        cached = _detection_cache.get(key)
+        if cached is not None:
+            _detection_cache.move_to_end(key)
+    
+    if cached is None:
+        size = (round(img_np.shape[1] * scale), round(img_np.shape[0] * scale))
+        # One index per detector weights, so retrained models start fresh
+        index = get_phash_index(fingerprint) if dedupe else None
+        if index is not None:
+            image_hash, thumbnail = phash(img_np), content_thumbnail(img_np)
+        match = index.lookup(img_np, roi, image_hash, thumbnail) if index is not None else None
+        
+        if match is not None:
+            # Stored boxes are in the matched image's pixels
+            xyxy, confs, (width, height) = match
+            ratio = np.array([size[0] / width, size[1] / height] * 2)
+            cached = (xyxy * ratio, confs)
+        else:
+            xyxy, confs = detect_image(model, img_np, CACHE_CONF_THRESHOLD, roi)
+            cached = (xyxy * scale, confs)
+            if index is not None:
+                index.add(img_np, *cached, size, roi, image_hash, thumbnail)
+        
+        with _cache_lock:
+            _detection_cache[key] = cached
+            while len(_detection_cache) > DETECTION_CACHE_SIZE:
+                _detection_cache.popitem(last=False)
+    
+    xyxy, confs = cached
+    mask = confs >= conf_threshold
+    return xyxy[mask], confs[mask]
+
+def clear_detection_cache():
+    """Forget cached detections (e.g. after swapping weights)"""
+    with _cache_lock:
+        _detection_cache.clear()
+
+def _file_name(uploaded_file):
+    return getattr(uploaded_file, 'name', str(uploaded_file))
+
+def index_similar(embedding, digest, name, summary):
+    """Most similar past samples for an embedding, then store the embedding"""
+    try:
+        index = get_embedding_index()
+        similar = index.search(embedding, exclude=digest)
+        index.add(embedding, sample_metadata(digest, name, summary))
+        return similar
+    except Exception:
+        # Retrieval is an extra; it must never fail a detection
+        return []
+
+def predict_image_with_viz(uploaded_file, conf_threshold=0.50, user_level="Public",
+                           render=True, prefilter=False, roi=True, dedupe=False, similar=True):
+    """
+    YOLO detection with visualization (render=False skips the annotated image)
+    prefilter=True (opt-in) returns an empty result without running the
+    network when the image has no particle-like blobs; roi=True restricts
+    detection to the filter membrane when one is found; dedupe=True (opt-in)
+    reuses the stored result of a verified near-duplicate image; similar=True
+    adds the most similar past samples (backbone embeddings from the same
+    forward pass)
+    """
     try:
-        # Load model
-        try:
-            model = YOLO('models/yolo/best.pt')
-        except:
-            try:
-                model = YOLO('runs/detect/train4/weights/best.pt')
-            except:
-                return {'error': 'Model not found'}
+        # Shared model (loaded and warmed once per process)
+        model = get_model()
+        if model is None:
+            return {'error': 'Model not found'}
         
         # Read image
-        image = Image.open(uploaded_file).convert("RGB")
-        img_np = np.array(image)
-        img_draw = img_np.copy()
+        data = _read_bytes(uploaded_file)
+        img_bgr, scale = decode_image(data)
         
-        # Run inference
-        results = model(img_np, conf=conf_threshold)[0]
+        # Blank filter regions never reach the network
+        if prefilter and is_empty_frame(img_bgr, _file_name(uploaded_file)):
+            summary = empty_result()
+            if render:
+                summary['annotated_image'] = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
+            return summary
         
-        # Process detections
-        type_counts = {"fiber": 0, "fragment": 0, "pellet": 0}
-        confidences = []
-        detections_list = []
+        # Run inference (or reuse cached detections for this image)
+        digest = image_digest(data)
+        if similar:
+            attach_embedding_hook(model)
+            pop_embeddings()
+        xyxy, confs = detect_cached(model, img_bgr, digest, conf_threshold, scale, roi, dedupe)
         
-        for box in results.boxes:
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-            conf = float(box.conf[0])
-            
-            width = x2 - x1
-            height = y2 - y1
-            
-            mp_type = classify_microplastic_type(width, height)
-            type_counts[mp_type] += 1
-            confidences.append(conf)
-            
-            color = COLOR_MAP[mp_type]
-            
-            # Draw box
-            cv2.rectangle(img_draw, (x1, y1), (x2, y2), color, 2)
-            
-            # Add label
-            label = f"{mp_type.upper()} {conf:.2f}"
-            cv2.putText(img_draw, label, (x1, y1 - 8),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-            
-            detections_list.append({
-                "Type": mp_type.title(),
-                "Confidence": round(conf, 3),
-                "Width(px)": width,
-                "Height(px)": height
-            })
+        # Process detections
+        summary = summarize_detections(xyxy, confs)
         
-        count = len(results.boxes)
-        avg_confidence = np.mean(confidences) if confidences else 0.0
+        # Only set when the network actually ran for this image
+        embedding = pop_embeddings() if similar else None
+        if embedding is not None:
+            summary['similar_samples'] = index_similar(
+                embedding[0], digest, _file_name(uploaded_file), summary
+            )
         
-        # Convert BGR to RGB
-        img_draw_rgb = cv2.cvtColor(img_draw, cv2.COLOR_BGR2RGB)
+        if render:
+            summary['annotated_image'] = render_detections(img_bgr, xyxy, confs, scale)
         
-        return {
-            'count': count,
-            'avg_confidence': avg_confidence,
-            'particle_types': {k: v for k, v in type_counts.items() if v > 0},
-            'annotated_image': img_draw_rgb,
-            'detections_table': detections_list,
-            'individual_confidences': confidences
-        }
+        return summary
     
     except Exception as e:
-        return {'error': str(e), 'count': 0, 'avg_confidence': 0.0}
\ No newline at end of file
+        return {'error': str(e), 'count': 0, 'avg_confidence': 0.0}
+
+def _prepare_upload(uploaded_file, roi):
+    """Decode and crop to the membrane (runs on the decode thread pool)"""
+    data = _read_bytes(uploaded_file)
+    img, scale = decode_image(data)
+    img_input, offset, circle = roi_input(img, roi)
+    return img_input, scale, offset, circle, image_digest(data)
+
+def predict_images_batch(uploaded_files, conf_threshold=0.50, batch_size=BATCH_SIZE,
+                         decode_workers=DECODE_WORKERS, prefilter=None, roi=True,
+                         similar=True):
+    """
+    Batched YOLO detection for many uploads
+    Images are decoded in parallel, stacked into fixed-size batches and one
+    result per file is yielded (in upload order) as soon as its batch is done.
+    prefilter=None follows the PREFILTER_BATCH deployment switch.
+    """
+    files = list(uploaded_files)
+    if prefilter is None:
+        prefilter = PREFILTER_BATCH
+    
+    model = get_model()
+    if model is None:
+        for f in files:
+            yield {'file': _file_name(f), 'error': 'Model not found',
+                   'count': 0, 'avg_confidence': 0.0}
+        return
+    if similar:
+        attach_embedding_hook(model)
+    
+    batches = [files[i:i + batch_size] for i in range(0, len(files), batch_size)]
+    
+    with ThreadPoolExecutor(max_workers=decode_workers) as pool:
+        pending = [pool.submit(_prepare_upload, f, roi) for f in batches[0]] if batches else []
+        
+        for idx, batch in enumerate(batches):
+            decoding = pending
+            
+            # Decode the next batch while this one runs through the model
+            if idx + 1 < len(batches):
+                pending = [pool.submit(_prepare_upload, f, roi) for f in batches[idx + 1]]
+            
+            results = [None] * len(batch)
+            images, prepared, slots = [], [], []
+            for slot, future in enumerate(decoding):
+                try:
+                    img, scale, offset, circle, digest = future.result()
+                    if prefilter and is_empty_frame(img, _file_name(batch[slot])):
+                        results[slot] = empty_result()
+                        continue
+                    images.append(img)
+                    prepared.append((scale, offset, circle, digest))
+                    slots.append(slot)
+                except Exception as e:
+                    results[slot] = {'error': str(e), 'count': 0, 'avg_confidence': 0.0}
+            
+            if images:
+                try:
+                    pop_embeddings()
+                    outputs = predict(model, images, conf=conf_threshold, verbose=False)
+                    embeddings = pop_embeddings() if similar else None
+                    if embeddings is not None and len(embeddings) != len(images):
+                        embeddings = None
+                    
+                    for i, (slot, (scale, offset, circle, digest), output) in enumerate(
+                            zip(slots, prepared, outputs)):
+                        xyxy, confs = roi_restore(*boxes_to_arrays(output.boxes), offset, circle)
+                        results[slot] = summarize_detections(xyxy * scale, confs)
+                        if embeddings is not None:
+                            results[slot]['similar_samples'] = index_similar(
+                                embeddings[i], digest, _file_name(batch[slot]), results[slot]
+                            )
+                except Exception as e:
+                    for slot in slots:
+                        results[slot] = {'error': str(e), 'count': 0, 'avg_confidence': 0.0}
+            
+            for f, result in zip(batch, results):
+                result['file'] = _file_name(f)
+                yield result
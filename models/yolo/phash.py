@@ -0,0 +1,218 @@
+"""
+Perceptual-hash index of analysed images
+Re-uploads and recompressed or resized copies of a sample hash to within a
+few bits of the original. A 64-bit hash of a 32x32 downsample is decided
+by the membrane and holder, not the particles, so a hash hit is only a
+candidate: its stored detections are reused when a 128x128 high-pass
+thumbnail also matches the new image pixel for pixel (within
+recompression noise), which a single extra particle already breaks.
+
+Each detector (engine, weights path and mtime) gets its own index, so
+results never outlive the weights that produced them. An index is three
+append-only binary files: fixed-size records (hash, image size, box
+slice, thumbnail slot), a float32 box table and the thumbnails.
+"""
+
+import os
+import hashlib
+import threading
+import cv2
+import numpy as np
+
+PHASH_INDEX_DIR = 'outputs/phash_index'
+PHASH_TOLERANCE = 8        # max differing bits (of 64) for a candidate near-duplicate
+THUMB_SIDE = 128
+CONTENT_TOLERANCE = 10.0   # max grey-level difference between high-pass thumbnails
+INITIAL_CAPACITY = 1024
+
+RECORD_DTYPE = np.dtype([
+    ('hash', '<u8'),
+    ('width', '<u4'),
+    ('height', '<u4'),
+    ('box_offset', '<u8'),
+    ('box_count', '<u4'),
+    ('thumb_index', '<u4'),
+    ('roi', 'u1')
+])
+BOX_DTYPE = np.dtype('<f4')  # rows of x1, y1, x2, y2, conf
+THUMB_BYTES = THUMB_SIDE * THUMB_SIDE
+
+# Set bits per byte value, for popcount over uint8 views
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _grey(img_bgr):
+    return cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY) if img_bgr.ndim == 3 else img_bgr
+
+
+def phash(img_bgr):
+    """64-bit DCT perceptual hash of an image"""
+    small = cv2.resize(_grey(img_bgr), (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    # The DC term only encodes brightness, keep it out of the median
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def content_thumbnail(img_bgr):
+    """THUMB_SIDE x THUMB_SIDE grey thumbnail used to confirm a hash match"""
+    return cv2.resize(_grey(img_bgr), (THUMB_SIDE, THUMB_SIDE), interpolation=cv2.INTER_AREA)
+
+
+def same_content(thumb_a, thumb_b, tolerance=CONTENT_TOLERANCE):
+    """
+    True when two thumbnails differ only by recompression / resizing noise
+    Compared after removing the local background, so small dark or bright
+    particles that differ between the images are not averaged away
+    """
+    def high_pass(thumb):
+        return thumb.astype(np.float32) - cv2.medianBlur(thumb, 5).astype(np.float32)
+    return float(np.abs(high_pass(thumb_a) - high_pass(thumb_b)).max()) <= tolerance
+
+
+def hamming_distances(hashes, query):
+    """Bit distance from query to every hash in a uint64 array"""
+    xor = np.bitwise_xor(hashes, np.uint64(query))
+    if hasattr(np, 'bitwise_count'):
+        # NumPy >= 2.0 has a native popcount
+        return np.bitwise_count(xor).astype(np.int64)
+    return _POPCOUNT[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.int64)
+
+
+class PHashIndex:
+    """On-disk near-duplicate index mapping image hashes to stored detections"""
+
+    def __init__(self, index_dir=PHASH_INDEX_DIR, tolerance=PHASH_TOLERANCE):
+        self.index_dir = index_dir
+        self.tolerance = tolerance
+        self.records_path = os.path.join(index_dir, 'records.bin')
+        self.boxes_path = os.path.join(index_dir, 'boxes.bin')
+        self.thumbs_path = os.path.join(index_dir, 'thumbs.bin')
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        records = np.empty(0, dtype=RECORD_DTYPE)
+        if os.path.exists(self.records_path):
+            records = np.fromfile(self.records_path, dtype=RECORD_DTYPE)
+            n_boxes = self._file_size(self.boxes_path) // (5 * BOX_DTYPE.itemsize)
+            n_thumbs = self._file_size(self.thumbs_path) // THUMB_BYTES
+            # Drop a trailing record whose boxes or thumbnail never made it to disk
+            ends = records['box_offset'] + records['box_count']
+            records = records[(ends <= n_boxes) & (records['thumb_index'] < n_thumbs)]
+
+        # Growable buffers: appends are amortised O(1) instead of a full copy each
+        capacity = max(INITIAL_CAPACITY, 2 * len(records))
+        self._records = np.empty(capacity, dtype=RECORD_DTYPE)
+        self._hashes = np.empty(capacity, dtype=np.uint64)
+        self._records[:len(records)] = records
+        self._hashes[:len(records)] = records['hash']
+        self._count = len(records)
+
+    @staticmethod
+    def _file_size(path):
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    @property
+    def records(self):
+        return self._records[:self._count]
+
+    @property
+    def hashes(self):
+        return self._hashes[:self._count]
+
+    def __len__(self):
+        return self._count
+
+    def _read_thumbnail(self, index):
+        return np.fromfile(self.thumbs_path, dtype=np.uint8, count=THUMB_BYTES,
+                           offset=int(index) * THUMB_BYTES).reshape(THUMB_SIDE, THUMB_SIDE)
+
+    def lookup(self, img_bgr, roi=True, image_hash=None, thumbnail=None):
+        """
+        Stored (xyxy, confs, (width, height)) of a verified near-duplicate,
+        or None when no candidate within the hash tolerance has the same content
+        """
+        with self._lock:
+            hashes, records = self.hashes, self.records
+        if not len(hashes):
+            return None
+        image_hash = phash(img_bgr) if image_hash is None else image_hash
+        thumbnail = content_thumbnail(img_bgr) if thumbnail is None else thumbnail
+
+        distances = hamming_distances(hashes, image_hash)
+        candidates = np.flatnonzero((distances <= self.tolerance) & (records['roi'] == int(roi)))
+        for i in candidates[np.argsort(distances[candidates], kind='stable')]:
+            record = records[i]
+            if not same_content(thumbnail, self._read_thumbnail(record['thumb_index'])):
+                continue
+            boxes = np.fromfile(
+                self.boxes_path, dtype=BOX_DTYPE,
+                count=int(record['box_count']) * 5,
+                offset=int(record['box_offset']) * 5 * BOX_DTYPE.itemsize
+            ).reshape(-1, 5)
+            return boxes[:, :4].astype(float), boxes[:, 4].astype(float), \
+                (int(record['width']), int(record['height']))
+        return None
+
+    def add(self, img_bgr, xyxy, confs, size, roi=True, image_hash=None, thumbnail=None):
+        """Append an analysed image; size is the original (width, height)"""
+        image_hash = phash(img_bgr) if image_hash is None else image_hash
+        thumbnail = content_thumbnail(img_bgr) if thumbnail is None else thumbnail
+        boxes = np.hstack([np.asarray(xyxy).reshape(-1, 4),
+                           np.asarray(confs).reshape(-1, 1)]).astype(BOX_DTYPE)
+
+        with self._lock:
+            os.makedirs(self.index_dir, exist_ok=True)
+            record = np.zeros(1, dtype=RECORD_DTYPE)
+            record['hash'] = image_hash
+            record['width'], record['height'] = size
+            record['box_offset'] = self._file_size(self.boxes_path) // (5 * BOX_DTYPE.itemsize)
+            record['box_count'] = len(boxes)
+            record['thumb_index'] = self._file_size(self.thumbs_path) // THUMB_BYTES
+            record['roi'] = int(roi)
+
+            # Payload first, so a crash never leaves a record without its data
+            with open(self.thumbs_path, 'ab') as f:
+                np.ascontiguousarray(thumbnail, dtype=np.uint8).tofile(f)
+            with open(self.boxes_path, 'ab') as f:
+                boxes.tofile(f)
+            with open(self.records_path, 'ab') as f:
+                record.tofile(f)
+
+            if self._count == len(self._records):
+                # Readers keep the old buffers; the grown copies replace them
+                self._records = np.concatenate([self._records, np.empty_like(self._records)])
+                self._hashes = np.concatenate([self._hashes, np.empty_like(self._hashes)])
+            self._records[self._count] = record[0]
+            self._hashes[self._count] = image_hash
+            self._count += 1
+
+    def clear(self):
+        """Forget every stored image"""
+        with self._lock:
+            for path in (self.records_path, self.boxes_path, self.thumbs_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._load()
+
+
+_indexes = {}
+_index_lock = threading.Lock()
+
+
+def index_dir_for(fingerprint):
+    """Index directory of one detector fingerprint (engine|weights path|mtime)"""
+    digest = hashlib.blake2b(str(fingerprint).encode(), digest_size=8).hexdigest()
+    return os.path.join(PHASH_INDEX_DIR, digest)
+
+
+def get_phash_index(fingerprint):
+    """Process-wide index instance for one detector"""
+    index = _indexes.get(fingerprint)
+    if index is None:
+        with _index_lock:
+            index = _indexes.get(fingerprint)
+            if index is None:
+                index = _indexes[fingerprint] = PHashIndex(index_dir_for(fingerprint))
+    return index
@@ -0,0 +1,111 @@
+"""
+Empty-frame prefilter for the microplastic detector
+Blank or near-blank filter regions are recognised from contrast blobs on a
+downsampled grey image and skip YOLO entirely. Every decision is counted
+so the skip rate can be audited from the admin panel.
+"""
+
+import threading
+from collections import deque
+from datetime import datetime
+import cv2
+import numpy as np
+
+SCREEN_SIDE = 512          # longest side of the screening thumbnail
+MIN_PARTICLE_PX = 8        # smallest particle side (image pixels) the screen must keep
+BACKGROUND_KERNEL = 21     # median blur window for the background estimate
+CONTRAST_K = 6.0           # robust z-score a candidate pixel must exceed
+MIN_CONTRAST = 12.0        # absolute grey-level floor for candidate pixels
+MIN_BLOB_AREA = 2          # thumbnail pixels for a blob to count as a candidate
+MIN_BLOB_SIDE = 2          # thumbnail pixels the smallest particle must still span
+AUDIT_LOG_SIZE = 200
+
+_stats = {'screened': 0, 'skipped': 0}
+_skipped_log = deque(maxlen=AUDIT_LOG_SIZE)
+_stats_lock = threading.Lock()
+
+
+def screen_factor(height, width, min_particle_px=MIN_PARTICLE_PX):
+    """
+    Thumbnail scale: SCREEN_SIDE on the longest side, but never so small
+    that a min_particle_px particle averages away below MIN_BLOB_SIDE pixels
+    """
+    return max(SCREEN_SIDE / max(height, width), MIN_BLOB_SIDE / min_particle_px)
+
+
+def candidate_count(img_bgr, min_particle_px=MIN_PARTICLE_PX):
+    """Number of particle-like contrast blobs on a downsampled copy of the image"""
+    h, w = img_bgr.shape[:2]
+    factor = screen_factor(h, w, min_particle_px)
+    if factor < 1:
+        small = cv2.resize(img_bgr, (max(1, int(w * factor)), max(1, int(h * factor))),
+                           interpolation=cv2.INTER_AREA)
+    else:
+        small = img_bgr
+
+    grey = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+    background = cv2.medianBlur(grey, BACKGROUND_KERNEL)
+    diff = np.abs(grey.astype(np.float32) - background.astype(np.float32))
+
+    # Robust noise level (MAD) so uneven illumination doesn't trigger blobs
+    noise = 1.4826 * float(np.median(diff))
+    threshold = max(MIN_CONTRAST, CONTRAST_K * noise)
+    mask = (diff > threshold).astype(np.uint8)
+
+    n_labels, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    return int((areas >= MIN_BLOB_AREA).sum())
+
+
+def is_empty_frame(img_bgr, name=None):
+    """True when the image has no candidate particles; updates the audit counters"""
+    empty = candidate_count(img_bgr) == 0
+
+    with _stats_lock:
+        _stats['screened'] += 1
+        if empty:
+            _stats['skipped'] += 1
+            _skipped_log.append({
+                'Time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'Image': name or 'upload',
+                'Size': f"{img_bgr.shape[1]}x{img_bgr.shape[0]}"
+            })
+
+    return empty
+
+
+def empty_result():
+    """Detection result for a prefiltered frame (predict_image_with_viz schema)"""
+    return {
+        'count': 0,
+        'avg_confidence': 0.0,
+        'particle_types': {},
+        'detections_table': {
+            "Type": np.array([], dtype=str),
+            "Confidence": np.array([], dtype=float),
+            "Width(px)": np.array([], dtype=np.int64),
+            "Height(px)": np.array([], dtype=np.int64)
+        },
+        'individual_confidences': [],
+        'prefiltered': True
+    }
+
+
+def prefilter_stats():
+    """Screened/skipped counters and the most recent skipped images"""
+    with _stats_lock:
+        screened, skipped = _stats['screened'], _stats['skipped']
+        recent = list(_skipped_log)
+    return {
+        'screened': screened,
+        'skipped': skipped,
+        'skip_rate': skipped / screened if screened else 0.0,
+        'recent_skipped': recent
+    }
+
+
+def reset_prefilter_stats():
+    with _stats_lock:
+        _stats['screened'] = 0
+        _stats['skipped'] = 0
+        _skipped_log.clear()
@@ -0,0 +1,162 @@
+"""
+Process-wide YOLO model registry
+Each weight file is loaded and warmed up once, then shared by every view.
+When exported ONNX / OpenVINO graphs sit next to the .pt weights (see
+models/yolo/export.py) the fastest full-precision one with an installed
+runtime is used; INT8 graphs only on request, and exports older than the
+weights are ignored.
+"""
+
+import os
+import threading
+import importlib.util
+import numpy as np
+from ultralytics import YOLO
+
+DEFAULT_WEIGHTS = [
+    'models/yolo/best.pt',
+    'runs/detect/train4/weights/best.pt'
+]
+WARMUP_SIZE = 640
+
+# Full-precision engines, fastest first on CPU ('auto' tries them in this order).
+# INT8 exports trade accuracy for speed, so they are only used when
+# requested explicitly (YOLO_ENGINE=openvino-int8 or onnx-int8)
+ENGINES = ['openvino', 'onnx', 'pytorch']
+ENGINE_RUNTIMES = {
+    'openvino-int8': 'openvino',
+    'openvino': 'openvino',
+    'onnx-int8': 'onnxruntime',
+    'onnx': 'onnxruntime',
+    'pytorch': 'torch'
+}
+ENGINE = os.getenv('YOLO_ENGINE', 'auto')
+
+_models = {}
+_resolved = {}
+_infer_locks = {}
+_registry_lock = threading.Lock()
+
+
+def engine_weights(weights_path, engine):
+    """Path of the exported variant of weights_path for an engine"""
+    base = os.path.splitext(weights_path)[0]
+    return {
+        'openvino-int8': base + '_int8_openvino_model',
+        'openvino': base + '_openvino_model',
+        'onnx-int8': base + '.int8.onnx',
+        'onnx': base + '.onnx',
+        'pytorch': weights_path
+    }[engine]
+
+
+def is_stale(weights_path, exported):
+    """True when an export is older than its .pt weights (exported before retraining)"""
+    if exported == weights_path or not os.path.exists(weights_path):
+        return False
+    return os.path.getmtime(exported) < os.path.getmtime(weights_path)
+
+
+def available_engines(weights_path, engines=ENGINES):
+    """Engines with an up-to-date exported artifact and an installed runtime"""
+    return [
+        engine for engine in engines
+        if os.path.exists(engine_weights(weights_path, engine))
+        and not is_stale(weights_path, engine_weights(weights_path, engine))
+        and importlib.util.find_spec(ENGINE_RUNTIMES[engine]) is not None
+    ]
+
+
+def engine_of(model_path):
+    """Engine an exported (or .pt) model path belongs to"""
+    path = model_path.rstrip(os.sep)
+    if path.endswith('_int8_openvino_model'):
+        return 'openvino-int8'
+    if path.endswith('_openvino_model'):
+        return 'openvino'
+    if path.endswith('.int8.onnx'):
+        return 'onnx-int8'
+    if path.endswith('.onnx'):
+        return 'onnx'
+    return 'pytorch'
+
+
+def model_fingerprint(model):
+    """'engine|path|mtime' of the weights a registry model was loaded from"""
+    return getattr(model, 'registry_fingerprint', None)
+
+
+def load_model(weights_path, warmup=True):
+    """Load a YOLO model once per process and return the shared instance"""
+    model = _models.get(weights_path)
+    if model is not None:
+        return model
+
+    with _registry_lock:
+        # Another thread may have finished loading while we waited
+        model = _models.get(weights_path)
+        if model is None:
+            model = YOLO(weights_path, task='detect')
+            # Identifies these exact weights to caches that outlive the process
+            mtime = os.stat(weights_path).st_mtime_ns if os.path.exists(weights_path) else 0
+            model.registry_fingerprint = f"{engine_of(weights_path)}|{os.path.abspath(weights_path)}|{mtime}"
+            if warmup:
+                dummy = np.zeros((WARMUP_SIZE, WARMUP_SIZE, 3), dtype=np.uint8)
+                model(dummy, verbose=False)
+            _infer_locks[id(model)] = threading.Lock()
+            _models[weights_path] = model
+
+    return model
+
+
+def get_model(candidates=None, engine=None):
+    """
+    Return the first detector that loads from the candidate weight paths
+    engine picks a backend ('onnx', 'openvino-int8', ...); 'auto' uses the
+    fastest full-precision export available and falls back to the .pt
+    weights. Exports older than the weights are skipped.
+    """
+    engine = engine or ENGINE
+    for path in candidates or DEFAULT_WEIGHTS:
+        resolved = _resolved.get((path, engine))
+        if resolved in _models and not is_stale(path, resolved):
+            return _models[resolved]
+
+        if engine == 'auto':
+            variants = [engine_weights(path, e) for e in available_engines(path)]
+        else:
+            variants = [engine_weights(path, e) for e in available_engines(path, [engine])]
+        variants = variants or [path]
+
+        for variant in variants:
+            try:
+                model = load_model(variant)
+                _resolved[(path, engine)] = variant
+                return model
+            except Exception:
+                continue
+    return None
+
+
+def predict(model, source, **kwargs):
+    """Run inference on a shared model, one caller at a time"""
+    # Ultralytics predictors keep per-call state, so concurrent sessions
+    # must not drive the same instance simultaneously
+    lock = _infer_locks.get(id(model))
+    if lock is None:
+        return model(source, **kwargs)
+    with lock:
+        return model(source, **kwargs)
+
+
+def loaded_models():
+    """Weight paths currently held in memory"""
+    return list(_models.keys())
+
+
+def clear_models():
+    """Drop every cached model (e.g. after retraining)"""
+    with _registry_lock:
+        _models.clear()
+        _resolved.clear()
+        _infer_locks.clear()
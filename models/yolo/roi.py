@@ -0,0 +1,101 @@
+"""
+Filter-membrane region of interest
+The round membrane is located once per image on a downsampled copy; the
+detector then only sees the membrane's bounding square with the holder
+and background masked out, and boxes are mapped back to the full image.
+A Hough circle is only accepted when most of its rim is a consistent
+brightness step (membrane vs. holder), so photos without a membrane keep
+the full frame.
+"""
+
+import cv2
+import numpy as np
+
+ROI_SCREEN_SIDE = 512
+MIN_RADIUS_FRAC = 0.3      # of the shorter image side
+MAX_RADIUS_FRAC = 0.75
+ROI_MARGIN = 1.03          # grow the circle slightly so edge particles survive
+MIN_RIM_SUPPORT = 0.7      # fraction of the visible rim with a same-sign brightness step
+MIN_RIM_VISIBLE = 0.5      # fraction of the rim that must lie inside the image
+RIM_CONTRAST = 8.0         # grey levels between just inside and just outside the rim
+RIM_SAMPLES = 360
+
+
+def rim_support(grey, cx, cy, r):
+    """
+    Fraction of the circle's in-image rim where the grey level steps by at
+    least RIM_CONTRAST in the dominant direction (inside brighter or darker),
+    and the fraction of the rim that is inside the image at all
+    """
+    h, w = grey.shape
+    angles = np.linspace(0, 2 * np.pi, RIM_SAMPLES, endpoint=False)
+    delta = max(3.0, 0.04 * r)
+
+    def ring(radius):
+        xs = np.round(cx + radius * np.cos(angles)).astype(int)
+        ys = np.round(cy + radius * np.sin(angles)).astype(int)
+        inside = (xs >= 0) & (xs < w) & (ys >= 0) & (ys < h)
+        return np.where(inside, grey[np.clip(ys, 0, h - 1), np.clip(xs, 0, w - 1)], np.nan)
+
+    step = ring(r - delta) - ring(r + delta)
+    visible = ~np.isnan(step)
+    if not visible.any():
+        return 0.0, 0.0
+    step = step[visible]
+    support = max((step > RIM_CONTRAST).mean(), (step < -RIM_CONTRAST).mean())
+    return float(support), float(visible.mean())
+
+
+def find_membrane(img_bgr):
+    """(cx, cy, r) of the filter membrane in image pixels, or None if not found"""
+    h, w = img_bgr.shape[:2]
+    factor = min(1.0, ROI_SCREEN_SIDE / max(h, w))
+    small = cv2.resize(img_bgr, (max(1, int(w * factor)), max(1, int(h * factor))),
+                       interpolation=cv2.INTER_AREA) if factor < 1 else img_bgr
+
+    grey = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+    grey = cv2.medianBlur(grey, 5)
+    short_side = min(grey.shape[:2])
+
+    circles = cv2.HoughCircles(
+        grey, cv2.HOUGH_GRADIENT, dp=1.5, minDist=short_side,
+        param1=100, param2=40,
+        minRadius=int(MIN_RADIUS_FRAC * short_side),
+        maxRadius=int(MAX_RADIUS_FRAC * short_side)
+    )
+    if circles is None:
+        return None
+
+    # Hough votes alone accept spurious circles in cluttered photos
+    for cx, cy, r in circles[0]:
+        support, visible = rim_support(grey.astype(np.float32), cx, cy, r)
+        if r >= MIN_RADIUS_FRAC * short_side and support >= MIN_RIM_SUPPORT and visible >= MIN_RIM_VISIBLE:
+            return float(cx / factor), float(cy / factor), float(r / factor * ROI_MARGIN)
+    return None
+
+
+def crop_to_membrane(img_bgr, circle):
+    """
+    Membrane bounding square with everything outside the circle filled with
+    the membrane's median colour; returns (crop, (x0, y0)) offset in the image
+    """
+    h, w = img_bgr.shape[:2]
+    cx, cy, r = circle
+    x0, y0 = max(0, int(cx - r)), max(0, int(cy - r))
+    x1, y1 = min(w, int(np.ceil(cx + r))), min(h, int(np.ceil(cy + r)))
+
+    crop = img_bgr[y0:y1, x0:x1].copy()
+    yy, xx = np.ogrid[y0:y1, x0:x1]
+    outside = (xx - cx) ** 2 + (yy - cy) ** 2 > r ** 2
+    if outside.any() and (~outside).any():
+        crop[outside] = np.median(crop[~outside], axis=0).astype(crop.dtype)
+
+    return crop, (x0, y0)
+
+
+def inside_membrane(xyxy, circle):
+    """Mask of boxes whose centre lies on the membrane"""
+    cx, cy, r = circle
+    centres_x = (xyxy[:, 0] + xyxy[:, 2]) / 2
+    centres_y = (xyxy[:, 1] + xyxy[:, 3]) / 2
+    return (centres_x - cx) ** 2 + (centres_y - cy) ** 2 <= r ** 2
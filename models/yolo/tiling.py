@@ -0,0 +1,303 @@
+"""
+Sliced (tiled) YOLO inference for high-resolution filter scans
+Overlapping tiles are read from disk one batch at a time and boxes are
+merged across tile seams with a global NMS
+"""
+
+import struct
+import numpy as np
+from PIL import Image
+from models.yolo.infer import summarize_detections, boxes_to_arrays
+from models.yolo.registry import get_model, predict
+
+TILE_SIZE = 640
+TILE_OVERLAP = 0.2
+TILE_BATCH = 8
+MERGE_THRESHOLD = 0.5
+DECODE_MAX_PIXELS = 100_000_000   # largest scan decoded whole (formats without region reads)
+LEVEL_SAMPLE_SIDE = 1024          # strided sample for the intensity range of >8-bit scans
+LEVEL_PERCENTILES = (0.1, 99.9)
+
+
+def scan_levels(arr):
+    """
+    Intensity range (low, high) mapped to 0-255 for a scan that is not uint8
+    Taken from percentiles of a strided sample, so a 12-bit camera stored as
+    uint16 uses the full 8-bit range and a few hot pixels don't darken it
+    """
+    step = max(1, int(np.ceil(max(arr.shape[:2]) / LEVEL_SAMPLE_SIDE)))
+    sample = np.asarray(arr[::step, ::step], dtype=np.float32)
+    low, high = np.percentile(sample, LEVEL_PERCENTILES)
+    return float(low), float(max(high, low + 1e-6))
+
+
+def _to_bgr(region, levels=None):
+    """
+    Contiguous uint8 BGR copy of an RGB image region (detector input order)
+    Other dtypes are scaled from levels (low, high), by default their full range
+    """
+    region = np.asarray(region)
+    if region.dtype != np.uint8:
+        if levels is None:
+            levels = (np.iinfo(region.dtype).min, np.iinfo(region.dtype).max) \
+                if np.issubdtype(region.dtype, np.integer) else (0.0, 1.0)
+        low, high = levels
+        scaled = (region.astype(np.float32) - low) * (255.0 / (high - low))
+        region = np.clip(scaled, 0, 255).astype(np.uint8)
+    if region.ndim == 2:
+        region = np.repeat(region[:, :, None], 3, axis=2)
+    elif region.shape[2] == 4:
+        region = region[:, :, :3]
+    return np.ascontiguousarray(region[:, :, ::-1])
+
+
+def memmap_scan(path):
+    """Read-only memory map of a .npy or uncompressed TIFF scan, else None"""
+    path = str(path)
+
+    if path.lower().endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+
+    if path.lower().endswith(('.tif', '.tiff')):
+        try:
+            import tifffile
+            return tifffile.memmap(path, mode='r')
+        except Exception:
+            # Compressed TIFF or tifffile missing
+            return None
+
+    return None
+
+
+def zarr_scan(path, max_chunk_pixels=DECODE_MAX_PIXELS):
+    """
+    Region-readable zarr view of a compressed (tiled or stripped) TIFF and
+    the store to close afterwards, else (None, None)
+    Slicing decodes only the tiles or strips it touches.
+    """
+    if not str(path).lower().endswith(('.tif', '.tiff')):
+        return None, None
+    try:
+        import tifffile
+        import zarr
+        store = tifffile.imread(str(path), aszarr=True)
+    except Exception:
+        # zarr / tifffile missing or not a TIFF tifffile can read
+        return None, None
+
+    try:
+        arr = zarr.open(store, mode='r')
+        if isinstance(arr, zarr.Group):
+            # Pyramidal TIFF: level 0 is full resolution
+            arr = arr['0']
+        if arr.chunks[0] * arr.chunks[1] <= max_chunk_pixels:
+            return arr, store
+    except Exception:
+        pass
+    # A single strip of the whole image is no better than decoding it
+    store.close()
+    return None, None
+
+
+def open_large_image(path, max_pixels=DECODE_MAX_PIXELS):
+    """
+    Lazily opened PIL image of a trusted scan, checked against max_pixels
+    Scans are far beyond Pillow's decompression-bomb guard; rather than
+    switching the process-wide guard off (it also protects public uploads),
+    the format plugin is opened directly and only this call gets the
+    larger limit. The image owns its file, as with Image.open, so loading
+    or closing it releases the handle.
+    """
+    Image.init()
+    fp = open(str(path), 'rb')
+    try:
+        prefix = fp.read(16)
+        for fmt in Image.ID:
+            factory, accept = Image.OPEN[fmt]
+            accepted = accept(prefix) if accept else True
+            if not accepted or isinstance(accepted, str):
+                continue
+            try:
+                fp.seek(0)
+                image = factory(fp, str(path))
+            except (SyntaxError, IndexError, TypeError, struct.error):
+                continue
+            if image.width * image.height > max_pixels:
+                raise ValueError(
+                    f"Scan has {image.width * image.height} pixels, more than {max_pixels} can be "
+                    f"decoded at once; save it as a tiled TIFF or .npy for region reads"
+                )
+            image._exclusive_fp = True
+            return image
+    except Exception:
+        fp.close()
+        raise
+
+    fp.close()
+    raise ValueError(f"Unrecognised image format: {path}")
+
+
+def decode_scan(path, max_pixels=DECODE_MAX_PIXELS):
+    """Whole scan decoded with PIL (up to max_pixels) as an RGB or >8-bit grey array"""
+    with open_large_image(path, max_pixels) as image:
+        if image.mode not in ('I;16', 'I;16L', 'I;16B', 'I', 'F'):
+            image = image.convert('RGB')
+        return np.asarray(image)
+
+
+class ScanReader:
+    """
+    Region reads from a scan of any size with bounded memory
+    .npy and uncompressed TIFF are memory-mapped and compressed or tiled
+    TIFF goes through zarr, so only the requested tiles are ever read;
+    other formats are decoded whole, up to DECODE_MAX_PIXELS. Scans that
+    are not uint8 are scaled to 0-255 with one intensity range per scan.
+    """
+
+    def __init__(self, path):
+        self._store = None
+        self.array = memmap_scan(path)
+        if self.array is None:
+            self.array, self._store = zarr_scan(path)
+        if self.array is None:
+            self.array = decode_scan(path)
+        self.height, self.width = self.array.shape[:2]
+        self.levels = None if self.array.dtype == np.uint8 else scan_levels(self.array)
+
+    def read_region(self, y0, y1, x0, x1):
+        return _to_bgr(self.array[y0:y1, x0:x1], self.levels)
+
+    def overview(self, max_side):
+        """Downscaled BGR overview and the factor back to full resolution"""
+        step = max(1, int(np.ceil(max(self.height, self.width) / max_side)))
+        overview = self.read_region(0, self.height, 0, self.width) if step == 1 \
+            else _to_bgr(self.array[::step, ::step], self.levels)
+        return overview, max(self.height, self.width) / max(overview.shape[:2])
+
+    def close(self):
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_scan(path):
+    """Open a scan for region reads (a ScanReader, usable as a context manager)"""
+    return ScanReader(path)
+
+
+def tile_offsets(length, tile_size, stride):
+    """Start offsets along one axis so tiles cover [0, length)"""
+    if length <= tile_size:
+        return [0]
+    offsets = list(range(0, length - tile_size + 1, stride))
+    if offsets[-1] + tile_size < length:
+        offsets.append(length - tile_size)
+    return offsets
+
+
+def iter_tiles(height, width, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """Yield (y0, y1, x0, x1) windows covering the image with overlap"""
+    stride = max(1, int(tile_size * (1 - overlap)))
+    for y0 in tile_offsets(height, tile_size, stride):
+        for x0 in tile_offsets(width, tile_size, stride):
+            yield y0, min(y0 + tile_size, height), x0, min(x0 + tile_size, width)
+
+
+def nms(xyxy, scores, threshold=MERGE_THRESHOLD, metric='ios'):
+    """
+    Greedy class-agnostic NMS, returns kept indices (highest score first)
+    metric 'ios' (intersection over smaller box) merges the partial boxes a
+    particle leaves on either side of a tile seam; 'iou' is the usual overlap
+    """
+    if len(scores) == 0:
+        return np.empty(0, dtype=int)
+
+    x1, y1, x2, y2 = xyxy[:, 0], xyxy[:, 1], xyxy[:, 2], xyxy[:, 3]
+    areas = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    order = np.argsort(-scores)
+    keep = []
+
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+
+        iw = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        ih = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = iw * ih
+
+        if metric == 'ios':
+            overlap = inter / (np.minimum(areas[i], areas[rest]) + 1e-9)
+        else:
+            overlap = inter / (areas[i] + areas[rest] - inter + 1e-9)
+
+        order = rest[overlap <= threshold]
+
+    return np.array(keep, dtype=int)
+
+
+def detect_windows(model, read_region, windows, conf_threshold, tile_size=TILE_SIZE,
+                   batch_size=TILE_BATCH):
+    """
+    Run the detector over image windows a batch at a time
+    Returns (xyxy, confs) in full-image coordinates, before seam merging
+    """
+    all_boxes, all_confs = [], []
+    tiles, batch_windows = [], []
+
+    def flush():
+        outputs = predict(model, tiles, conf=conf_threshold, imgsz=tile_size, verbose=False)
+        for (y0, _, x0, _), output in zip(batch_windows, outputs):
+            xyxy, confs = boxes_to_arrays(output.boxes)
+            if len(confs):
+                all_boxes.append(xyxy + np.array([x0, y0, x0, y0], dtype=xyxy.dtype))
+                all_confs.append(confs)
+        tiles.clear()
+        batch_windows.clear()
+
+    for window in windows:
+        tiles.append(read_region(*window))
+        batch_windows.append(window)
+        if len(tiles) == batch_size:
+            flush()
+    if tiles:
+        flush()
+
+    if not all_confs:
+        return np.empty((0, 4)), np.empty(0)
+    return np.concatenate(all_boxes), np.concatenate(all_confs)
+
+
+def predict_image_tiled(scan_path, conf_threshold=0.50, tile_size=TILE_SIZE,
+                        overlap=TILE_OVERLAP, batch_size=TILE_BATCH,
+                        merge_threshold=MERGE_THRESHOLD):
+    """
+    Tiled YOLO detection for very large scans
+    Only one batch of tiles is held in memory at a time; the result has the
+    same schema as predict_image_with_viz (without the annotated image)
+    """
+    try:
+        model = get_model()
+        if model is None:
+            return {'error': 'Model not found', 'count': 0, 'avg_confidence': 0.0}
+
+        with open_scan(scan_path) as scan:
+            height, width = scan.height, scan.width
+            windows = list(iter_tiles(height, width, tile_size, overlap))
+            xyxy, confs = detect_windows(model, scan.read_region, windows, conf_threshold,
+                                         tile_size, batch_size)
+        keep = nms(xyxy, confs, merge_threshold)
+
+        summary = summarize_detections(xyxy[keep], confs[keep])
+        summary['tiles'] = len(windows)
+        summary['image_size'] = (width, height)
+        return summary
+
+    except Exception as e:
+        return {'error': str(e), 'count': 0, 'avg_confidence': 0.0}
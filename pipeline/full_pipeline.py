@@ -6,7 +6,7 @@ from models.pinn.predict_do import predict_dissolved_oxygen
 from models.digital_twin.simulate import run_digital_twin_simulation
 
 def run_pipeline(image, raman_vec, features):
-    yolo = predict_image_with_viz(image)
+    yolo = predict_image_with_viz(image, render=False)
     raman = predict_polymer(raman_vec)
     wqi = predict_wqi(features)
     forecast = forecast_wqi(wqi["wqi_score"])
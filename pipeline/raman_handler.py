@@ -1,5 +1,11 @@
-import pandas as pd
 import os
+import sys
+from pathlib import Path
+
+# Make the project root importable when run from pipeline/
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from models.raman.dataset import dataset_summary
 
 CSV_PATH = "../data/raman_dataset/raman_merged_labeled.csv"
 
@@ -7,14 +13,15 @@ def run_raman():
     if not os.path.exists(CSV_PATH):
         return {"error": "Raman dataset not found"}
 
-    df = pd.read_csv(CSV_PATH)
+    # Row and class counts are precomputed when the CSV is first cached
+    summary = dataset_summary(CSV_PATH)
 
     # Use the 'class' column as the detected material/polymer category
-    materials = df["class"].dropna().unique().tolist()
+    materials = summary["classes"]
 
     return {
         "status": "Raman data processed",
-        "total_samples": len(df),
+        "total_samples": summary["rows"],
         "unique_classes_found": len(materials),
         "detected_material_classes": materials[:10]  # show first 10 for clean output
     }
@@ -0,0 +1,223 @@
+"""
+Watch-folder bulk ingestion for YOLO detection
+Polls a drop directory, feeds new images to a pool of detector worker
+processes (each with its own preloaded model) and appends one JSON line
+per image to the results file. Files already in the results file are
+never processed again, so the watcher can be restarted at any time.
+Failed detections are logged too but retried with backoff, so a
+transient error (model missing, out of memory) never marks a file done.
+The folder is listed once per poll interval, not per finished image, and
+files already processed are not stat'ed again except in a full rescan
+every RESCAN_INTERVAL (which picks up a processed file replaced in place).
+
+Usage (from pipeline/, like pipeline_main.py):
+    python watch_folder.py ../drop --results ../outputs/yolo_results.jsonl --workers 4
+"""
+
+import os
+import json
+import time
+import argparse
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp')
+POLL_INTERVAL = 2.0
+RETRY_DELAY = 10.0          # seconds before the first retry, doubled per failure
+MAX_ATTEMPTS = 5            # per file version and watcher run
+RESCAN_INTERVAL = 60.0      # seconds between re-stats of already processed files
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+
+def _init_worker():
+    """Load the detector once in each worker process"""
+    import yolo_handler  # noqa: F401  (loads and warms the model on import)
+
+
+def _detect(path):
+    from yolo_handler import run_yolo
+    return run_yolo(path)
+
+
+def file_key(path, stat=None):
+    """Identity of a file version: path, size and modification time"""
+    stat = stat or os.stat(path)
+    return f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+def is_error(result):
+    return result.get("status") == "error"
+
+
+def load_ledger(results_path):
+    """Keys of every file successfully written to the results file"""
+    done = set()
+    if not os.path.exists(results_path):
+        return done
+    with open(results_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                if not is_error(record):
+                    done.add(record['file_key'])
+            except (ValueError, KeyError):
+                # Partially written last line after a crash
+                continue
+    return done
+
+
+def key_path(key):
+    """Absolute path part of a file key"""
+    return key.rsplit('|', 2)[0]
+
+
+def scan_drop_dir(drop_dir, skip=None):
+    """
+    (path, file key) of the image files in the drop directory, oldest first
+    Files whose absolute path is in skip are left out without a stat.
+    """
+    files = []
+    for entry in os.scandir(drop_dir):
+        if not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        if skip and os.path.abspath(entry.path) in skip:
+            continue
+        try:
+            # One stat per file and poll, reused for the sort and the key
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        if entry.is_file():
+            files.append((stat.st_mtime_ns, entry.path, file_key(entry.path, stat)))
+    files.sort()
+    return [(path, key) for _, path, key in files]
+
+
+def watch(drop_dir, results_path, workers=DEFAULT_WORKERS, poll_interval=POLL_INTERVAL, once=False):
+    """
+    Process every new image in drop_dir until interrupted
+    A file is only submitted once its size and mtime are unchanged across
+    two polls, so images still being copied in are not picked up early.
+    With once=True all current files are processed and the call returns.
+    """
+    results_dir = os.path.dirname(os.path.abspath(results_path))
+    os.makedirs(results_dir, exist_ok=True)
+
+    done = load_ledger(results_path)
+    handled = {key_path(key) for key in done}   # absolute paths with a processed version
+    seen = {}          # path -> key at the previous poll
+    failures = {}      # path -> (key, attempts, retry_at)
+    in_flight = {}     # future -> (path, key)
+    ready = deque()    # stable files waiting for a free worker slot
+    max_in_flight = workers * 2
+    processed = waiting = 0
+    next_scan = next_full_scan = 0.0
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool, \
+            open(results_path, 'a') as out:
+        while True:
+            now = time.monotonic()
+            scanned = now >= next_scan
+            if scanned:
+                full = now >= next_full_scan
+                files = scan_drop_dir(drop_dir, None if full else handled)
+                next_scan = now + poll_interval
+                if full:
+                    next_full_scan = now + RESCAN_INTERVAL
+
+                # Forget files that have left the drop directory
+                present = {path for path, _ in files}
+                seen = {path: key for path, key in seen.items() if path in present}
+                failures = {path: f for path, f in failures.items() if path in present}
+
+                busy = {path for path, _ in in_flight.values()}
+                ready.clear()
+                waiting = 0
+                for path, key in files:
+                    if key in done or path in busy:
+                        continue
+                    # A new version of a processed file is tracked every poll again
+                    handled.discard(key_path(key))
+
+                    failure = failures.get(path)
+                    if failure is not None and failure[0] == key:
+                        if failure[1] >= MAX_ATTEMPTS:
+                            continue
+                        if time.time() < failure[2]:
+                            waiting += 1
+                            continue
+
+                    # Wait until the file has stopped changing
+                    if not once and seen.get(path) != key:
+                        seen[path] = key
+                        waiting += 1
+                        continue
+
+                    ready.append((path, key))
+
+            while ready and len(in_flight) < max_in_flight:
+                path, key = ready.popleft()
+                in_flight[pool.submit(_detect, path)] = (path, key)
+                seen.pop(path, None)
+
+            if in_flight:
+                finished, _ = wait(list(in_flight), timeout=max(0.0, next_scan - time.monotonic()),
+                                   return_when=FIRST_COMPLETED)
+            else:
+                finished = []
+                # Only a fresh scan can tell that nothing is left
+                if once and scanned and not waiting and not ready:
+                    break
+                time.sleep(max(0.0, next_scan - time.monotonic()))
+
+            for future in finished:
+                path, key = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"status": "error", "msg": str(e)}
+
+                record = {
+                    "file_key": key,
+                    "path": path,
+                    "processed_at": datetime.now().isoformat(timespec='seconds'),
+                    **result
+                }
+                if is_error(result):
+                    failure = failures.get(path)
+                    attempts = failure[1] + 1 if failure is not None and failure[0] == key else 1
+                    failures[path] = (key, attempts, time.time() + RETRY_DELAY * 2 ** (attempts - 1))
+                    record["attempt"] = attempts
+
+                # One line per image, flushed so results survive a crash
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                if not is_error(result):
+                    done.add(key)
+                    handled.add(key_path(key))
+                    failures.pop(path, None)
+                    processed += 1
+
+    return processed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch a drop folder and run YOLO on new images")
+    parser.add_argument('drop_dir')
+    parser.add_argument('--results', default='../outputs/yolo_results.jsonl')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--poll', type=float, default=POLL_INTERVAL)
+    parser.add_argument('--once', action='store_true', help="Process current files and exit")
+    args = parser.parse_args()
+
+    print(f"\n👀 Watching {args.drop_dir} with {args.workers} workers → {args.results}\n")
+    try:
+        count = watch(args.drop_dir, args.results, args.workers, args.poll, args.once)
+        print(f"\n✅ Processed {count} images\n")
+    except KeyboardInterrupt:
+        print("\n🛑 Watcher stopped\n")
+
+
+if __name__ == '__main__':
+    main()
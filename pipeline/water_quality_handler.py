@@ -1,9 +1,15 @@
-import joblib
+import sys
+from pathlib import Path
 import pandas as pd
 from difflib import get_close_matches
 
-MODEL_PATH = "../model/river_wqi_model.pkl"
-model = joblib.load(MODEL_PATH)
+# Make the project root importable when run from pipeline/
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from models.artifacts import get_model
+
+# Resolved against this file so the handler works from any directory
+MODEL_PATH = str(Path(__file__).resolve().parent / "../model/river_wqi_model.pkl")
 
 REQUIRED = [
     "Temperature","Dissolved Oxygen","pH",
@@ -33,6 +39,8 @@ def classify_wqi(value):
 
 def run_water_quality(data):
     df = format_input(data)
+    # Cached across calls, hot-reloaded when the model file changes
+    model = get_model(MODEL_PATH)
     raw_pred = model.predict(df)[0]
 
     # 🎯 CASE 1 → MODEL RETURNS STRING LIKE "Excellent"
@@ -1,14 +1,23 @@
-from ultralytics import YOLO
 import os
+import sys
+from pathlib import Path
+
+# Make the project root importable when run from pipeline/
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from models.yolo.registry import get_model, predict
 
 MODEL_PATH = "../yolov8n.pt"
-model = YOLO(MODEL_PATH)
+# Fastest exported backend next to MODEL_PATH (ONNX / OpenVINO), else PyTorch
+model = get_model([MODEL_PATH])
 
 def run_yolo(image_path):
     if not os.path.exists(image_path):
         return {"status": "error", "msg": "Image not found", "path": image_path}
+    if model is None:
+        return {"status": "error", "msg": "Model not found", "path": MODEL_PATH}
 
-    results = model(image_path)
+    results = predict(model, image_path)
     boxes = results[0].boxes
 
     count = len(boxes)
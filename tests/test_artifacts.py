@@ -0,0 +1,66 @@
+import os
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import AdaBoostRegressor, BaggingClassifier, RandomForestClassifier
+from sklearn.tree import DecisionTreeRegressor
+
+from models import artifacts
+from models.artifacts import convert_pickle, load_model, MANIFEST
+
+
+def _data(seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(300, 6))
+    return X, X[:, 0] + 2 * X[:, 1] ** 2 + rng.normal(0, 0.1, len(X))
+
+
+def _convert(model, tmp_path):
+    path = str(tmp_path / 'model.pkl')
+    joblib.dump(model, path)
+    return path, convert_pickle(path)
+
+
+@pytest.mark.parametrize('model, classify', [
+    (AdaBoostRegressor(DecisionTreeRegressor(max_depth=3), n_estimators=20, random_state=0), False),
+    (BaggingClassifier(max_features=0.5, n_estimators=10, random_state=0), True),
+])
+def test_weighted_or_subsampled_ensembles_use_joblib(model, classify, tmp_path):
+    X, y = _data()
+    model.fit(X, y > np.median(y) if classify else y)
+    path, manifest = _convert(model, tmp_path)
+
+    assert manifest['format'] == 'joblib'
+    expected = model.predict_proba(X) if classify else model.predict(X)
+    loaded = load_model(path)
+    np.testing.assert_allclose(loaded.predict_proba(X) if classify else loaded.predict(X), expected)
+
+
+def test_random_forest_flattened(tmp_path):
+    X, y = _data()
+    model = RandomForestClassifier(n_estimators=15, random_state=0).fit(X, y > np.median(y))
+    path, manifest = _convert(model, tmp_path)
+
+    assert manifest['format'] == 'tree_ensemble'
+    np.testing.assert_allclose(load_model(path).predict_proba(X), model.predict_proba(X))
+
+
+def test_failed_check_keeps_previous_artifact(tmp_path, monkeypatch):
+    X, y = _data()
+    path, _ = _convert(RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y > 0), tmp_path)
+    artifact_dir = artifacts.artifact_path(path)
+    before = open(os.path.join(artifact_dir, MANIFEST)).read()
+
+    joblib.dump(RandomForestClassifier(n_estimators=7, random_state=1).fit(X, y > 0), path)
+    monkeypatch.setattr(artifacts, '_same_predictions', lambda *args: False)
+    with pytest.raises(ValueError):
+        convert_pickle(path)
+
+    assert open(os.path.join(artifact_dir, MANIFEST)).read() == before
+    assert not os.path.exists(artifact_dir + '.tmp')
+
+
+def test_default_pickles_resolved_from_project_root():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(artifacts.__file__)))
+    assert os.path.join(root, 'model', 'river_wqi_model.pkl') in artifacts.DEFAULT_PICKLES
+    assert all(os.path.isabs(p) for p in artifacts.DEFAULT_PICKLES)
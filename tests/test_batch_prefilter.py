@@ -0,0 +1,25 @@
+import io
+import cv2
+import numpy as np
+
+from models.yolo import infer
+from models.yolo.prefilter import prefilter_stats, reset_prefilter_stats
+
+
+def _png(img):
+    return io.BytesIO(cv2.imencode('.png', img)[1].tobytes())
+
+
+def test_batch_screens_empty_frames_by_default(monkeypatch):
+    monkeypatch.setattr(infer, 'get_model', lambda: object())
+    ran = []
+    monkeypatch.setattr(infer, 'predict', lambda model, images, **kw: ran.append(len(images)) or [])
+    reset_prefilter_stats()
+
+    blank = np.full((480, 640, 3), 200, dtype=np.uint8)
+    results = list(infer.predict_images_batch([_png(blank), _png(blank)], roi=False, similar=False))
+
+    assert [r['count'] for r in results] == [0, 0]
+    assert ran == []
+    assert prefilter_stats()['screened'] == 2
+    reset_prefilter_stats()
@@ -0,0 +1,55 @@
+import numpy as np
+
+from models.yolo import infer
+
+
+class FakeModel:
+    def __init__(self, fingerprint):
+        self.registry_fingerprint = fingerprint
+
+
+def test_cache_keyed_by_weights_fingerprint(monkeypatch):
+    calls = []
+
+    def detect_image(model, img, conf, roi):
+        calls.append(model.registry_fingerprint)
+        return np.array([[1.0, 2.0, 3.0, 4.0]]), np.array([0.9])
+
+    monkeypatch.setattr(infer, 'detect_image', detect_image)
+    infer.clear_detection_cache()
+    img = np.zeros((64, 64, 3), dtype=np.uint8)
+
+    infer.detect_cached(FakeModel('pytorch|best.pt|1'), img, 'digest', 0.5)
+    infer.detect_cached(FakeModel('pytorch|best.pt|1'), img, 'digest', 0.5)
+    assert calls == ['pytorch|best.pt|1']
+
+    # Retrained weights: same image, new detections
+    infer.detect_cached(FakeModel('pytorch|best.pt|2'), img, 'digest', 0.5)
+    assert calls == ['pytorch|best.pt|1', 'pytorch|best.pt|2']
+    infer.clear_detection_cache()
+
+
+def test_dedupe_answers_recompressed_copy_from_index(monkeypatch, tmp_path):
+    import cv2
+    from models.yolo import phash
+
+    monkeypatch.setattr(phash, 'PHASH_INDEX_DIR', str(tmp_path))
+    calls = []
+
+    def detect_image(model, img, conf, roi):
+        calls.append(1)
+        return np.array([[10.0, 10.0, 30.0, 30.0]]), np.array([0.9])
+
+    monkeypatch.setattr(infer, 'detect_image', detect_image)
+    infer.clear_detection_cache()
+
+    rng = np.random.default_rng(0)
+    img = cv2.GaussianBlur(rng.integers(0, 256, (256, 320, 3), dtype=np.uint8), (0, 0), 3)
+    img[100:110, 50:60] = 0
+    copy = cv2.imdecode(cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 95])[1], cv2.IMREAD_COLOR)
+    model = FakeModel(f'pytorch|{tmp_path}/best.pt|1')
+
+    infer.detect_cached(model, img, 'original', 0.5, dedupe=True)
+    xyxy, _ = infer.detect_cached(model, copy, 'reupload', 0.5, dedupe=True)
+    assert len(calls) == 1 and len(xyxy) == 1
+    infer.clear_detection_cache()
@@ -0,0 +1,37 @@
+import numpy as np
+
+from models.yolo.embeddings import EmbeddingIndex
+
+
+def _meta(digest):
+    return {'digest': digest, 'file': f'{digest}.png'}
+
+
+def test_reprocessed_files_are_stored_once(tmp_path):
+    rng = np.random.default_rng(0)
+    a, b = rng.normal(size=64), rng.normal(size=64)
+    index = EmbeddingIndex(str(tmp_path))
+    for _ in range(4):
+        index.add(a, _meta('a'))
+        index.add(b, _meta('b'))
+    assert len(index) == 2
+    assert len(EmbeddingIndex(str(tmp_path))) == 2
+
+    # Still skipped after a reload
+    assert not EmbeddingIndex(str(tmp_path)).add(a, _meta('a'))
+
+
+def test_search_collapses_repeated_digests(tmp_path):
+    rng = np.random.default_rng(1)
+    a = rng.normal(size=64)
+    index = EmbeddingIndex(str(tmp_path))
+    # Repeats written by older versions, which didn't check digests
+    for _ in range(4):
+        index._digests = set()
+        index.add(a, _meta('a'))
+    for name in 'bcdefg':
+        index.add(rng.normal(size=64), _meta(name))
+
+    results = index.search(a + 0.01 * rng.normal(size=64), k=5)
+    files = [r['file'] for r in results]
+    assert files[0] == 'a.png' and len(files) == 5 and len(set(files)) == 5
@@ -0,0 +1,42 @@
+import cv2
+import numpy as np
+from models.yolo.phash import PHashIndex
+
+
+def _membrane(n_particles, side=1000):
+    """Same membrane and holder, different particles (identical 64-bit hashes)"""
+    rng = np.random.default_rng(n_particles)
+    yy, xx = np.mgrid[0:side, 0:int(side * 4 / 3)]
+    img = np.repeat((60 + 0.03 * xx + 0.02 * yy)[:, :, None], 3, axis=2).astype(np.uint8)
+    cv2.circle(img, (int(side * 0.62), int(side * 0.47)), int(side * 0.42), (200, 205, 210), -1)
+    cv2.rectangle(img, (0, 0), (200, 120), (20, 20, 20), -1)
+    noise = np.random.default_rng(99).normal(0, 3, img.shape)
+    img = np.clip(cv2.GaussianBlur(img, (0, 0), 2) + noise, 0, 255).astype(np.uint8)
+    for _ in range(n_particles):
+        angle, radius = rng.uniform(0, 2 * np.pi), rng.uniform(0, side * 0.38)
+        centre = (int(side * 0.62 + radius * np.cos(angle)), int(side * 0.47 + radius * np.sin(angle)))
+        cv2.circle(img, centre, 3, (40, 60, 80), -1)
+    return img
+
+
+def test_different_sample_is_not_a_duplicate(tmp_path):
+    index = PHashIndex(str(tmp_path))
+    index.add(_membrane(10), np.array([[1, 2, 3, 4]]), np.array([0.9]), (1333, 1000))
+
+    for n in (0, 3, 30):
+        assert index.lookup(_membrane(n)) is None
+
+
+def test_recompressed_copy_is_a_duplicate(tmp_path):
+    index = PHashIndex(str(tmp_path))
+    original = _membrane(10)
+    index.add(original, np.array([[1, 2, 3, 4]]), np.array([0.9]), (1333, 1000))
+
+    small = cv2.resize(original, None, fx=0.6, fy=0.6, interpolation=cv2.INTER_AREA)
+    _, jpeg = cv2.imencode('.jpg', small, [cv2.IMWRITE_JPEG_QUALITY, 70])
+    match = index.lookup(cv2.imdecode(jpeg, cv2.IMREAD_COLOR))
+    assert match is not None
+    assert match[2] == (1333, 1000)
+
+    # Survives a reload from disk
+    assert PHashIndex(str(tmp_path)).lookup(original) is not None
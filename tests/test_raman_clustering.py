@@ -0,0 +1,30 @@
+import tracemalloc
+import numpy as np
+
+from models.raman.clustering import knn_graph, block_size
+
+
+def test_knn_graph_matches_brute_force():
+    x = np.random.default_rng(0).normal(size=(3001, 20)).astype(np.float32)
+    assert block_size(20, 1, 5) < len(x)        # several blocks, ragged last one
+    scores, indices = knn_graph(x, 5, memory_budget_mb=1)
+
+    unit = x / np.linalg.norm(x, axis=1, keepdims=True)
+    sim = unit @ unit.T
+    np.fill_diagonal(sim, -np.inf)
+    np.testing.assert_allclose(np.sort(scores, axis=1), np.sort(sim, axis=1)[:, -5:], atol=1e-5)
+    np.testing.assert_allclose(np.take_along_axis(sim, indices, axis=1), scores, atol=1e-5)
+
+
+def test_knn_graph_peak_memory_within_budget():
+    n, d, k, budget_mb = 20000, 256, 10, 32
+    x = np.random.default_rng(1).normal(size=(n, d)).astype(np.float32)
+    tracemalloc.start()
+    try:
+        knn_graph(x, k, memory_budget_mb=budget_mb)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    # Running (N, k) scores and indices, their merge copies and the norms sit outside the budget
+    per_spectrum = 3 * k * (4 + 8) + 4
+    assert peak <= budget_mb * 1024 * 1024 + n * per_spectrum
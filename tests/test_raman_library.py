@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+from models.raman import library as lib
+from models.raman.resample import CANONICAL_AXIS
+
+
+def _reference_csv(path, n=60):
+    rng = np.random.default_rng(0)
+    axis = np.linspace(400, 3500, 300)
+    rows = []
+    for i in range(n):
+        centre = 800 + 400 * (i % 3)
+        rows.append(np.exp(-((axis - centre) / 20) ** 2) + 0.01 * rng.random(len(axis)))
+    df = pd.DataFrame(rows, columns=[f'{w:.2f}' for w in axis])
+    df['class'] = [['PE', 'PP', 'PS'][i % 3] for i in range(n)]
+    df.to_csv(path, index=False)
+
+
+def _reset(monkeypatch):
+    monkeypatch.setattr(lib, '_library', None)
+    monkeypatch.setattr(lib, '_building', None)
+    monkeypatch.setattr(lib, '_build_error', None)
+
+
+def test_index_is_built_in_background_and_memory_mapped(tmp_path, monkeypatch):
+    _reset(monkeypatch)
+    csv, index_dir = str(tmp_path / 'refs.csv'), str(tmp_path / 'index')
+    _reference_csv(csv)
+
+    assert lib.get_library(csv, index_dir) is None
+    lib._building.join()
+    library = lib.get_library(csv, index_dir)
+    assert isinstance(library.full, np.memmap) and len(library) == 60
+
+    query = np.exp(-((CANONICAL_AXIS - 1200) / 20) ** 2)
+    matches = library.search(query, k=3)
+    assert [m['label'] for m in matches] == ['PP'] * 3
+
+
+def test_wait_builds_in_the_calling_thread(tmp_path, monkeypatch):
+    _reset(monkeypatch)
+    csv, index_dir = str(tmp_path / 'refs.csv'), str(tmp_path / 'index')
+    _reference_csv(csv)
+
+    library = lib.get_library(csv, index_dir, wait=True)
+    assert isinstance(library.full, np.memmap)
+    assert lib._building is None
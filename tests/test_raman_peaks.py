@@ -0,0 +1,45 @@
+import numpy as np
+from scipy.signal import find_peaks, peak_prominences
+
+from models.raman.peaks import find_peaks_batch, _points, PROMINENCE_WINDOW_CM, MIN_PROMINENCE
+from models.raman.resample import CANONICAL_AXIS
+
+
+def random_spectra(n, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.arange(len(CANONICAL_AXIS))
+    spectra = np.zeros((n, len(x)))
+    for row in spectra:
+        for _ in range(rng.integers(3, 12)):
+            centre, fwhm, height = rng.uniform(0, len(x)), rng.uniform(2, 30), rng.uniform(5, 500)
+            row += height * np.exp(-4 * np.log(2) * (x - centre) ** 2 / fwhm ** 2)
+        row += rng.uniform(0, 200) * np.linspace(0, 1, len(x)) ** 2
+        row += rng.normal(0, rng.uniform(0.5, 5), len(x))
+    return spectra.astype(np.float32)
+
+
+def test_prominences_match_scipy():
+    spectra = random_spectra(200)
+    wlen = 2 * _points(PROMINENCE_WINDOW_CM) + 1
+    prominence, _ = find_peaks_batch(spectra, min_width=1)
+
+    for row, spectrum in zip(prominence, spectra.astype(np.float64)):
+        threshold = MIN_PROMINENCE * (spectrum.max() - spectrum.min())
+        expected, _ = find_peaks(spectrum, prominence=threshold, wlen=wlen)
+        found = np.flatnonzero(row)
+        np.testing.assert_array_equal(found, expected)
+        np.testing.assert_allclose(row[found], peak_prominences(spectrum, found, wlen=wlen)[0],
+                                   rtol=1e-5, atol=1e-3)
+
+
+def test_shoulder_base_stops_at_higher_neighbour():
+    # A small peak on the flank of a much taller one: the window minimum lies
+    # beyond the tall peak, but the base must stop at the valley between them
+    x = np.arange(len(CANONICAL_AXIS), dtype=np.float64)
+    spectrum = 1000 * np.exp(-((x - 500) / 8) ** 2) + 100 * np.exp(-((x - 520) / 3) ** 2)
+    wlen = 2 * _points(PROMINENCE_WINDOW_CM) + 1
+    prominence, _ = find_peaks_batch(spectrum, min_prominence=0.01)
+    shoulder = 520
+    assert prominence[0, shoulder] > 0
+    assert np.isclose(prominence[0, shoulder], peak_prominences(spectrum, [shoulder], wlen=wlen)[0][0],
+                      rtol=1e-5)
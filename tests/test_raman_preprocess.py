@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from models.raman.preprocess import despike
+from models.raman.resample import CANONICAL_AXIS
+
+
+def _band(centre, fwhm, height, noise=1.0, seed=0):
+    rng = np.random.default_rng(seed)
+    sigma = fwhm / 2.355
+    return 100 + height * np.exp(-0.5 * ((CANONICAL_AXIS - centre) / sigma) ** 2) \
+        + rng.normal(0, noise, len(CANONICAL_AXIS))
+
+
+@pytest.mark.parametrize('fwhm', [10, 15, 20])
+@pytest.mark.parametrize('height', [20, 200, 5000])
+def test_clean_band_unchanged(fwhm, height):
+    spectrum = _band(1600, fwhm, height)
+    np.testing.assert_array_equal(despike(spectrum)[0], spectrum)
+
+
+def test_spikes_removed():
+    clean = _band(1600, 15, 200)
+    spiked = clean.copy()
+    spiked[300] += 500          # one-point cosmic ray
+    spiked[600:602] += 400      # two-point cosmic ray
+
+    cleaned = despike(spiked)[0]
+    assert np.abs(cleaned[[300, 600, 601]] - clean[[300, 600, 601]]).max() < 5
+    # The band itself is untouched
+    band = np.abs(CANONICAL_AXIS - 1600) < 40
+    np.testing.assert_array_equal(cleaned[band], clean[band])
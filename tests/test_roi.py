@@ -0,0 +1,43 @@
+import cv2
+import numpy as np
+from models.yolo.infer import roi_input
+from models.yolo.roi import find_membrane
+
+
+def _cluttered_photo(seed):
+    """Rectangles and lines, no membrane (Hough alone finds circles in these)"""
+    rng = np.random.default_rng(seed)
+    img = np.full((600, 800, 3), 150, np.uint8)
+    for _ in range(40):
+        x, y = (int(v) for v in rng.integers(0, [800, 600]))
+        w, h = (int(v) for v in rng.integers(20, 200, 2))
+        cv2.rectangle(img, (x, y), (x + w, y + h), tuple(int(c) for c in rng.integers(0, 255, 3)), -1)
+    for _ in range(20):
+        p1 = tuple(int(v) for v in rng.integers(0, [800, 600]))
+        p2 = tuple(int(v) for v in rng.integers(0, [800, 600]))
+        cv2.line(img, p1, p2, (0, 0, 0), 3)
+    return img
+
+
+def _membrane_photo(noise=10):
+    rng = np.random.default_rng(0)
+    img = np.full((600, 800, 3), 90, np.uint8)
+    cv2.circle(img, (400, 300), 250, (210, 210, 210), -1)
+    for x, y in rng.integers(250, 550, (30, 2)):
+        cv2.circle(img, (int(x), int(y)), 4, (20, 20, 20), -1)
+    return np.clip(img + rng.normal(0, noise, img.shape), 0, 255).astype(np.uint8)
+
+
+def test_membrane_found():
+    cx, cy, r = find_membrane(_membrane_photo())
+    assert abs(cx - 400) < 10 and abs(cy - 300) < 10
+    assert 240 < r < 280
+
+
+def test_no_membrane_keeps_full_frame():
+    for seed in range(30):
+        img = _cluttered_photo(seed)
+        crop, offset, circle = roi_input(img, roi=True)
+        assert circle is None
+        assert offset == (0, 0)
+        assert crop is img
@@ -0,0 +1,51 @@
+import os
+import numpy as np
+import pytest
+from PIL import Image
+
+from models.yolo.tiling import open_scan, decode_scan
+
+
+def _open_fds():
+    return len(os.listdir('/proc/self/fd'))
+
+
+def test_uint16_scan_is_scaled_not_saturated(tmp_path):
+    # 12-bit camera data stored as uint16
+    scan = np.random.default_rng(0).integers(0, 4096, size=(900, 1200), dtype=np.uint16)
+    path = tmp_path / 'scan.npy'
+    np.save(path, scan)
+
+    with open_scan(path) as reader:
+        region = reader.read_region(0, 640, 0, 640)
+    assert region.dtype == np.uint8 and region.shape == (640, 640, 3)
+    assert region.min() < 10 and region.max() > 245
+    assert 100 < region.mean() < 155
+
+
+def test_compressed_tiff_read_by_region(tmp_path):
+    tifffile = pytest.importorskip('tifffile')
+    pytest.importorskip('zarr')
+    scan = np.random.default_rng(1).integers(0, 256, size=(2000, 3000, 3), dtype=np.uint8)
+    path = str(tmp_path / 'scan.tif')
+    tifffile.imwrite(path, scan, tile=(256, 256), compression='zlib')
+
+    with open_scan(path) as reader:
+        assert not isinstance(reader.array, np.ndarray)
+        region = reader.read_region(100, 740, 200, 840)
+        overview, scale = reader.overview(1000)
+    np.testing.assert_array_equal(region, scan[100:740, 200:840, ::-1])
+    assert max(overview.shape[:2]) <= 1000 and scale == 3.0
+
+
+def test_oversized_png_refused_and_file_closed(tmp_path):
+    path = str(tmp_path / 'scan.png')
+    Image.fromarray(np.zeros((400, 500, 3), dtype=np.uint8)).save(path)
+
+    before = _open_fds()
+    with pytest.raises(ValueError):
+        decode_scan(path, max_pixels=100_000)
+    assert decode_scan(path).shape == (400, 500, 3)
+    for _ in range(5):
+        open_scan(path).close()
+    assert _open_fds() == before
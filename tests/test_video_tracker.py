@@ -0,0 +1,93 @@
+import os
+import cv2
+import numpy as np
+from models.yolo import video
+from models.yolo.video import ParticleTracker
+
+
+def _box(x, y, size=20):
+    return np.array([[x, y, x + size, y + size]], dtype=float)
+
+
+def test_fast_particle_is_one_track():
+    # 20 px particle moving 15 px per processed frame (IoU between frames ~0.14)
+    tracker = ParticleTracker()
+    for frame in range(10):
+        tracker.update(frame, _box(100 + 15 * frame, 50), np.array([0.9]))
+
+    particles = tracker.particles()
+    assert len(particles) == 1
+    assert particles[0]['hits'] == 10
+
+
+def test_distant_particles_stay_separate():
+    tracker = ParticleTracker()
+    for frame in range(5):
+        xyxy = np.vstack([_box(50 + 10 * frame, 50), _box(400 - 10 * frame, 300)])
+        tracker.update(frame, xyxy, np.array([0.8, 0.7]))
+
+    assert len(tracker.particles()) == 2
+
+
+def test_empty_frames():
+    tracker = ParticleTracker()
+    tracker.update(0, np.empty((0, 4)), np.empty(0))
+    tracker.update(1, _box(10, 10), np.array([0.9]))
+    tracker.update(2, np.empty((0, 4)), np.empty(0))
+    assert tracker.particles() == []
+
+
+class _Array:
+    def __init__(self, values):
+        self.values = values
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.values
+
+
+class _Output:
+    def __init__(self, xyxy):
+        self.boxes = type('Boxes', (), {'xyxy': _Array(xyxy), 'conf': _Array(np.full(len(xyxy), 0.9))})()
+
+
+def _dark_blob_detector(model, frames, conf=None, verbose=False):
+    outputs = []
+    for frame in frames:
+        ys, xs = np.nonzero(frame[:, :, 0] < 120)
+        xyxy = np.array([[xs.min(), ys.min(), xs.max() + 1, ys.max() + 1]], dtype=float) \
+            if len(xs) else np.empty((0, 4))
+        outputs.append(_Output(xyxy))
+    return outputs
+
+
+def _write_clip(directory, n_frames, step):
+    rng = np.random.default_rng(0)
+    for i in range(n_frames):
+        frame = np.clip(180 + rng.normal(0, 2, (240, 640, 3)), 0, 255).astype(np.uint8)
+        x = 20 + step * i
+        frame[100:112, x:x + 12] = 60
+        cv2.imwrite(os.path.join(directory, f'{i:03d}.png'), frame)
+
+
+def _predict(monkeypatch, directory):
+    monkeypatch.setattr(video, 'get_model', lambda: object())
+    monkeypatch.setattr(video, 'predict', _dark_blob_detector)
+    return video.predict_video(str(directory))
+
+
+def test_moving_particle_frames_are_processed(tmp_path, monkeypatch):
+    # 12 px particle moving 10 px per frame: a tiny change in the frame mean
+    _write_clip(tmp_path, 60, 10)
+    result = _predict(monkeypatch, tmp_path)
+    assert result['frames_skipped'] == 0
+    assert result['count'] == 1
+
+
+def test_static_clip_skips_but_not_forever(tmp_path, monkeypatch):
+    _write_clip(tmp_path, 45, 0)
+    result = _predict(monkeypatch, tmp_path)
+    assert result['frames_processed'] == 5      # frames 0, 11, 22, 33, 44
+    assert result['count'] == 1
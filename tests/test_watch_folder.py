@@ -0,0 +1,56 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from pipeline import watch_folder
+
+
+def _drop(directory, names):
+    for name in names:
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(name.encode())
+
+
+def _run(monkeypatch, drop, results, detect):
+    monkeypatch.setattr(watch_folder, 'ProcessPoolExecutor',
+                        lambda max_workers, initializer: ThreadPoolExecutor(max_workers))
+    monkeypatch.setattr(watch_folder, '_detect', detect)
+    return watch_folder.watch(str(drop), str(results), workers=2, poll_interval=0.01, once=True)
+
+
+def test_processed_files_are_not_rescanned(tmp_path, monkeypatch):
+    drop, results = tmp_path / 'drop', tmp_path / 'results.jsonl'
+    drop.mkdir()
+    _drop(drop, ['a.png', 'b.png', 'c.png'])
+    calls = []
+
+    def detect(path):
+        calls.append(os.path.basename(path))
+        return {'status': 'ok', 'count': 1}
+
+    assert _run(monkeypatch, drop, results, detect) == 3
+    assert sorted(calls) == ['a.png', 'b.png', 'c.png']
+
+    # Restart: the ledger marks them done and they are skipped without a stat
+    _drop(drop, ['d.png'])
+    assert _run(monkeypatch, drop, results, detect) == 1
+    assert calls[-1] == 'd.png' and len(calls) == 4
+    handled = {os.path.abspath(os.path.join(drop, n)) for n in ['a.png', 'b.png', 'c.png']}
+    assert [os.path.basename(p) for p, _ in watch_folder.scan_drop_dir(str(drop), handled)] == ['d.png']
+
+
+def test_errors_are_retried_not_marked_done(tmp_path, monkeypatch):
+    drop, results = tmp_path / 'drop', tmp_path / 'results.jsonl'
+    drop.mkdir()
+    _drop(drop, ['a.png'])
+    monkeypatch.setattr(watch_folder, 'RETRY_DELAY', 0.0)
+    attempts = []
+
+    def detect(path):
+        attempts.append(path)
+        return {'status': 'error', 'msg': 'boom'} if len(attempts) < 3 else {'status': 'ok'}
+
+    assert _run(monkeypatch, drop, results, detect) == 1
+    records = [json.loads(line) for line in open(results)]
+    assert [r.get('attempt') for r in records] == [1, 2, None]
+    assert len(watch_folder.load_ledger(str(results))) == 1
@@ -382,6 +382,35 @@ def show_admin_panel():
         })
         
         st.dataframe(security_events, use_container_width=True, hide_index=True)
+        
+        # Detection prefilter audit
+        st.markdown("---")
+        st.markdown("### 🧹 Empty-Frame Prefilter")
+        
+        try:
+            from models.yolo.prefilter import prefilter_stats
+            from models.yolo.infer import PREFILTER_BATCH
+            pf = prefilter_stats()
+            
+            st.caption(
+                "Screening batch uploads" if PREFILTER_BATCH
+                else "Screening is off (YOLO_PREFILTER_BATCH=0)"
+            )
+            
+            pf_col1, pf_col2, pf_col3 = st.columns(3)
+            with pf_col1:
+                st.metric("Images Screened", f"{pf['screened']:,}")
+            with pf_col2:
+                st.metric("Skipped (no candidates)", f"{pf['skipped']:,}")
+            with pf_col3:
+                st.metric("Skip Rate", f"{pf['skip_rate']:.1%}")
+            
+            if pf['recent_skipped']:
+                st.dataframe(pd.DataFrame(pf['recent_skipped'][::-1]), use_container_width=True, hide_index=True)
+            else:
+                st.caption("No images skipped since the server started")
+        except Exception as e:
+            st.info(f"Prefilter statistics unavailable: {e}")
     
     # ====================================
     # TAB 5: CONFIGURATION
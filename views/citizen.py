@@ -72,12 +72,13 @@ def show_citizen_dashboard():
             if st.button("🚀 Analyze Sample", type="primary", use_container_width=True):
                 with st.spinner("Running YOLOv8 detection... Please wait"):
                     try:
-                        from models.yolo.infer import predict_image_with_viz
+                        from models.yolo.infer import predict_image_with_viz, DEDUPE_UPLOADS
                         
                         result = predict_image_with_viz(
                             uploaded_file,
                             conf_threshold=st.session_state.confidence_threshold,
-                            user_level="Public"
+                            user_level="Public",
+                            dedupe=DEDUPE_UPLOADS
                         )
                         
                         if 'error' not in result:
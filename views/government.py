@@ -98,8 +98,9 @@ def show_government_dashboard():
                     progress_bar.progress(16)
                     
                     try:
-                        from models.yolo.infer import predict_image_with_viz
-                        yolo_result = predict_image_with_viz(uploaded, 0.35, "Government")
+                        from models.yolo.infer import predict_image_with_viz, DEDUPE_UPLOADS
+                        yolo_result = predict_image_with_viz(uploaded, 0.35, "Government",
+                                                             dedupe=DEDUPE_UPLOADS)
                         st.session_state.yolo_result = yolo_result
                     except Exception as e:
                         st.error(f"YOLO detection failed: {e}")
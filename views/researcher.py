@@ -128,26 +128,40 @@ def show_researcher_dashboard():
             
             st.plotly_chart(fig, use_container_width=True)
             
+            preprocess = st.checkbox(
+                "Preprocess spectrum for library, mixture and peak analysis "
+                "(despike, baseline removal, smoothing, normalization)",
+                value=False,
+                help="The polymer classifier was trained on raw spectra and always receives the raw spectrum"
+            )
+            
             # Analyze button
             if st.button("🚀 Analyze Spectrum", type="primary", use_container_width=True):
                 with st.spinner("Running Raman ML model..."):
                     try:
                         from models.raman.infer import predict_polymer
+                        from models.raman.resample import resample_spectra, axis_coverage
                         
                         # Prepare spectrum (use intensity values)
                         spectrum = spectrum_data['intensity'].values
+                        wavenumbers = spectrum_data['wavenumber'].values
                         
-                        # Ensure correct length (1024 for model)
-                        if len(spectrum) != 1024:
-                            spectrum = np.interp(
-                                np.linspace(0, len(spectrum)-1, 1024),
-                                np.arange(len(spectrum)),
-                                spectrum
-                            )
+                        # Resample onto the model's wavenumber grid (1024 points)
+                        coverage = axis_coverage(wavenumbers)
+                        if coverage < 0.9:
+                            st.warning(f"⚠️ Spectrum covers only {coverage:.0%} of the model's wavenumber range")
+                        spectrum = resample_spectra(spectrum, wavenumbers)
                         
-                        # Get prediction
+                        # Get prediction (the classifier was trained on raw spectra)
                         result = predict_polymer(spectrum)
                         
+                        # Library, mixture and peak analysis optionally on the cleaned spectrum
+                        if preprocess:
+                            from models.raman.preprocess import preprocess_spectra
+                            analysis_spectrum = preprocess_spectra(spectrum)[0]
+                        else:
+                            analysis_spectrum = spectrum
+                        
                         st.markdown("---")
                         st.markdown("## 🎯 Analysis Results")
                         
@@ -217,26 +231,63 @@ def show_researcher_dashboard():
                             # Data table
                             st.dataframe(prob_df, use_container_width=True, hide_index=True)
                         
+                        # Reference library matches
+                        from models.raman.library import match_reference
+                        library_result = match_reference(analysis_spectrum, k=5)
+                        if library_result.get('building'):
+                            st.info("📚 The reference library index is being built in the background; "
+                                    "closest reference spectra will appear in a later analysis")
+                        if library_result['matches']:
+                            st.markdown("### 📚 Closest Reference Spectra")
+                            st.dataframe(
+                                pd.DataFrame(library_result['matches']).rename(columns={
+                                    'rank': 'Rank', 'reference': 'Reference #',
+                                    'label': 'Material', 'similarity': 'Cosine Similarity'
+                                }),
+                                use_container_width=True, hide_index=True
+                            )
+                        
+                        # Mixture composition (weathered / composite particles)
+                        from models.raman.unmixing import unmix_polymer
+                        mixture = unmix_polymer(analysis_spectrum)
+                        if mixture['fractions']:
+                            st.markdown("### 🧪 Estimated Mixture Composition")
+                            mix_df = pd.DataFrame([
+                                {'Polymer': k, 'Fraction': f"{v*100:.1f}%"}
+                                for k, v in sorted(mixture['fractions'].items(), key=lambda kv: -kv[1])
+                            ])
+                            st.dataframe(mix_df, use_container_width=True, hide_index=True)
+                            st.caption(f"Relative fit residual: {mixture['residual']:.3f}")
+                        
                         # Characteristic peaks
                         st.markdown("---")
                         st.markdown("### 🎯 Characteristic Peaks Identified")
                         
-                        polymer_peaks = {
-                            'PE': [(2850, 'C-H symmetric stretch'), (2880, 'C-H asymmetric stretch'), (2900, 'C-H stretch')],
-                            'PP': [(841, 'C-C stretch'), (973, 'C-H rock'), (2840, 'C-H stretch')],
-                            'PS': [(1001, 'Ring breathing'), (1602, 'Aromatic C=C'), (3050, 'Aromatic C-H')],
-                            'PET': [(1616, 'Aromatic ring'), (1730, 'C=O stretch'), (2970, 'C-H stretch')],
-                            'PVC': [(638, 'C-Cl stretch'), (1430, 'CH2 bend'), (2910, 'C-H stretch')],
-                            'PMMA': [(814, 'C-O stretch'), (1730, 'C=O stretch'), (2950, 'C-H stretch')]
-                        }
+                        from models.raman.peaks import POLYMER_PEAKS, peak_report, match_peaks
                         
                         detected_polymer = result['polymer']
-                        if detected_polymer in polymer_peaks:
-                            peaks = polymer_peaks[detected_polymer]
+                        if detected_polymer in POLYMER_PEAKS:
+                            peaks = POLYMER_PEAKS[detected_polymer]
                             
-                            peak_df = pd.DataFrame(peaks, columns=['Wavenumber (cm⁻¹)', 'Assignment'])
+                            # Check each band against the peaks actually found in the spectrum
+                            report = peak_report(analysis_spectrum, detected_polymer)
+                            peak_df = pd.DataFrame([
+                                {
+                                    'Wavenumber (cm⁻¹)': r['wavenumber'],
+                                    'Assignment': r['assignment'],
+                                    'Found': '✅' if r['found'] else '—',
+                                    'Prominence': round(r['prominence'], 3)
+                                }
+                                for r in report
+                            ])
                             st.table(peak_df)
                             
+                            template_match = match_peaks(analysis_spectrum)
+                            best_template = template_match['best'][0]
+                            if best_template != detected_polymer:
+                                st.info(f"ℹ️ Peak template check favours {best_template} "
+                                        f"({template_match['best_score'][0]:.0%} of its bands found)")
+                            
                             # Plot with peaks marked
                             fig_peaks = go.Figure()
                             fig_peaks.add_trace(go.Scatter(
@@ -483,24 +534,48 @@ def show_researcher_dashboard():
         )
         
         if batch_files and st.button("Process Batch", type="primary"):
+            from models.yolo.infer import predict_images_batch
+
             progress = st.progress(0)
+            table = st.empty()
             results_list = []
-            
-            for idx, file in enumerate(batch_files):
-                st.write(f"Processing {file.name}...")
-                # Mock processing
+
+            image_files = [f for f in batch_files if not f.name.lower().endswith('.csv')]
+            for file in batch_files:
+                if file.name.lower().endswith('.csv'):
+                    results_list.append({
+                        'File': file.name,
+                        'Status': 'Skipped (not an image)',
+                        'Particles': None,
+                        'Confidence': None,
+                        'Most Similar': None
+                    })
+
+            # Results stream in batch by batch
+            for result in predict_images_batch(
+                image_files,
+                conf_threshold=st.session_state.get('confidence_threshold', 0.10)
+            ):
                 results_list.append({
-                    'File': file.name,
-                    'Status': 'Success',
-                    'Particles': np.random.randint(10, 200),
-                    'Confidence': np.random.uniform(0.7, 0.95)
+                    'File': result['file'],
+                    'Status': f"Error: {result['error']}" if 'error' in result else 'Success',
+                    'Particles': result.get('count', 0),
+                    'Confidence': round(float(result.get('avg_confidence', 0.0)), 3),
+                    'Most Similar': ', '.join(
+                        s['file'] for s in result.get('similar_samples', [])[:3]
+                    ) or None
                 })
-                progress.progress((idx + 1) / len(batch_files))
-            
-            results_df = pd.DataFrame(results_list)
-            st.dataframe(results_df, use_container_width=True)
-            
-            st.success(f"✅ Processed {len(batch_files)} files successfully!")
+                progress.progress(len(results_list) / len(batch_files))
+                table.dataframe(pd.DataFrame(results_list), use_container_width=True)
+
+            if not image_files:
+                table.dataframe(pd.DataFrame(results_list), use_container_width=True)
+
+            failed = sum(1 for r in results_list if r['Status'].startswith('Error'))
+            if failed:
+                st.warning(f"⚠️ Processed {len(batch_files)} files, {failed} failed")
+            else:
+                st.success(f"✅ Processed {len(batch_files)} files successfully!")
     
     # ==========================
     # TAB 5: DATA EXPLORER